@@ -1,76 +1,330 @@
 import json
+import queue
+import threading
 import time
-from pynput import keyboard
+from concurrent.futures import Future
+try:
+    from pynput import keyboard
+except ImportError: #no keyboard access (e.g. no display); procedures can still be replayed headless
+    keyboard = None
 from rdflib import Graph, Namespace, URIRef, Literal
 from rdflib.namespace import RDF, RDFS, OWL, XSD
-from pyshacl import validate
 
 #local imports
 import queries
-from ontology_utils import load_and_materialize_ontology, parse_json_to_rdflib, query_result_to_list, get_label_from_uri
-from question_mode import question_mode, display_question_menu
+from ontology_utils import load_and_materialize_ontology, compile_sensor_data, query_result_to_list, get_label_from_uri, coalesce_changes, COALESCE_SIZE
+from graph_journal import GraphJournal
+from question_mode import question_mode, display_question_menu, AnswerCache
+from procedure_index import ProcedureIndex, STRUCTURAL_PREDICATES
+from step_profiles import StepResourceProfiles
+from lookahead import compute_lookahead
+from materializer import IncrementalMaterializer
+from sensor_stream import SensorStream
+from overlay_store import OverlayStore, OverlaySet, overlay_graph
+from compact_store import CompactStore, compact_graph
+from shacl_utils import get_shape_predicates, get_scoped_shapes_graph, run_pyshacl, InferredDataGraph, CONFORMING_REPORT
+from shape_compiler import CompiledShapes
+from instrumentation import metrics, profile
 
 
 OR = Namespace("http://www.semanticweb.org/Twin_OR/")
 
 class ORSimulator:
-    def __init__(self, ontology_path, shacl_shape_path, show_validation_report = False):
+    def __init__(self, ontology_path, shacl_shape_path, show_validation_report = False, incremental_validation = False, cache_dir = None, separate_schema_validation = False, native_validation = False, base_graph = None, validation_service = None, metrics_path = None, prefetch = False, incremental_reasoning = False, compact_store = False, snapshot_dir = None, base_inferred = None, base_closure = None, reasoner = "none"):
         
         self.input_ontology_path = ontology_path
-        self.materialized_ontology_path = "working_ontology.owl"
         self.prefix = "or"
         self.current_steps = ["Step_A1_1", "Step_A1_2"]
         self.current_phase = "A_Phase1"
         self.current_plan = "PlanA"
         self.show_validation_report = show_validation_report
+        self.incremental_validation = incremental_validation
+        self.cache_dir = cache_dir #materialization cache; None disables caching
+        self.reasoner = reasoner #reasoner the ontology is materialized with (see load_and_materialize_ontology)
+        self.graph_delta = [] #(action, triple) pairs applied to the graph since the last validation
+        self.graph_delta_limit = COALESCE_SIZE #length at which graph_delta is coalesced
+        self.graph_version = 0 #bumped on every change of or_graph
+        self.answer_cache = AnswerCache() #question mode answers, keyed on the graph version
+        self.last_validation_conforms = False
+        self.step_action_table = None #step label -> action labels, built lazily from or_graph
+        self.procedure_index = None #navigation index, built lazily from or_graph
+        self.step_profiles = None #tools, actors, capabilities and materials per step, built lazily from or_graph
         self.ongoing_procedure = True
         self.in_question_mode = False
         self.violation_occurred = False
         self.listener = None
+        self.prompt = input #reads user answers; replaced to run without a console
+        self.pause = time.sleep #paces messages for the user; replaced to run at full speed
+        self.events = queue.Queue() #key, sensor and question events, handled by the simulation loop
+        self.validation_service = validation_service #validates streamed sensor data in worker processes, if set
+        self.metrics = metrics #per-stage latency histograms, shared by all simulators of the process
+        self.metrics_path = metrics_path #file the latency statistics are written to when the simulation ends
+        self.profile_path = None #if set, the next advance is profiled with cProfile into this file
+        self.prefetch = prefetch #speculatively prepare the next advance while waiting for the user
+        self.lookahead = None #speculative results for the next advance (see lookahead.py)
+        self.lookahead_thread = None #computes self.lookahead in the background
+
+        #Load the Twin OR ontology with RDFlib, or layer this simulator's changes over a shared one
+        if base_graph is None and snapshot_dir is not None: #map a prebuilt snapshot, with the changes in an overlay
+            self.or_graph = overlay_graph(load_and_materialize_ontology(self.input_ontology_path, reasoner=self.reasoner, cache_dir=self.cache_dir, snapshot_dir=snapshot_dir))
+        elif base_graph is None:
+            self.or_graph = load_and_materialize_ontology(self.input_ontology_path, reasoner=self.reasoner, cache_dir=self.cache_dir)
+            if compact_store: #keep the ontology dictionary-encoded, with the changes in an overlay
+                self.or_graph = compact_graph(self.or_graph)
+        else:
+            self.or_graph = overlay_graph(base_graph)
+
+        #Keep the consequences of sensor updates (inverses, class memberships, ...) materialized;
+        #over a shared base graph materialized once (see prepare_base_graph), only track this
+        #simulator's changes of its inferred triples
+        if not incremental_reasoning:
+            self.materializer = None
+        elif base_inferred is not None:
+            self.materializer = IncrementalMaterializer(self.or_graph, inferred=OverlaySet(base_inferred))
+        else:
+            self.materializer = IncrementalMaterializer(self.or_graph)
 
-        #Load the Twin OR ontology with RDFlib
-        self.or_graph = load_and_materialize_ontology(self.input_ontology_path, OR, self.prefix)
+        self.graph_journal = GraphJournal(self.or_graph) #changes applied to or_graph, for rollback
+        self.step_savepoint = self.graph_journal.savepoint() #state before the current steps' sensor update
+        self.step_savepoints = [] #state before each step's sensor update since the journal was committed, oldest first
 
         #Load SHACL shapes
         shacl_shapes_graph = Graph()
         self.shacl_shapes_graph = shacl_shapes_graph.parse(shacl_shape_path)
+        self.shape_predicates = get_shape_predicates(self.shacl_shapes_graph)
+
+        #Compile the simple shapes into direct triple probes; the rest is left to pyshacl
+        self.compiled_shapes = CompiledShapes(self.shacl_shapes_graph) if native_validation else None
+
+        #Precompute the RDFS expansion once and maintain it from the sensor deltas instead of
+        #letting pyshacl re-expand the whole ontology on every validation (the compiled shapes
+        #are probed against it as well, and incremental validation needs it so that checking
+        #a delta does not cost an expansion of the whole ontology)
+        if separate_schema_validation or native_validation or incremental_validation:
+            self.inferred_graph = InferredDataGraph(self.or_graph, base=base_closure, compact=compact_store)
+        else:
+            self.inferred_graph = None
 
-        #Load sensor data
+        #Load sensor data and pre-compile it into graph changes
         with open('sensor_data.json') as file:
             self.sensor_data = json.load(file)
+        self.term_cache = {} #interned RDFLib terms of sensor data
+        self.sensor_changes = compile_sensor_data(self.sensor_data, OR, self.term_cache)
 
         
     def simulate_robotic_sensor_output_and_update_ontology(self):
         """
         Simulate robotic sensor data and update the ontology accordingly.
 
-        From a json file, retrieves simulated "sensor data" for the current steps, converts JSON
-        data to RDFLib triples, and updates the ontology graph by adding or removing triples 
-        according to simulated "sesnsor data".
+        Retrieves the simulated "sensor data" for the current steps (pre-compiled from a json 
+        file into RDFLib triples at load time), and updates the ontology graph in bulk by adding 
+        or removing triples according to simulated "sesnsor data".
 
         Args:
             None
 
         Updates:
             self.or_graph (rdflib.Graph): The ontology graph with added or removed triples.        
+            self.graph_delta (list): Extended with the applied (action, triple) pairs.
+            self.step_savepoint (int): Journal savepoint taken before the update.
+            self.step_savepoints (list): The savepoint is pushed, so the steps can be reverted.
         """
 
+        self.step_savepoint = self.graph_journal.savepoint()
+        self.step_savepoints.append(self.step_savepoint)
+        changes = []
+
         for step_ID in self.current_steps:
             #Extract data relevant to a step
-            step_data = self.sensor_data.get(step_ID, None)
+            changes.extend(self.sensor_changes.get(step_ID, []))
 
-            if step_data is not None:
-                triples = step_data.get("triples", [])
+        self.apply_graph_changes(changes)
+
+
+    def apply_graph_changes(self, changes):
+        """
+        Add triples to and remove triples from the ontology graph in bulk, keeping track of the changes.
+
+        All sensor-driven graph updates go through this method so that the graph journal, the 
+        graph delta and the caches derived from the graph stay consistent with it.
+
+        Args:
+            changes (list): (action, triple) pairs, where action is "add" or "remove".
+
+        Updates:
+            self.or_graph (rdflib.Graph): The triples are added or removed.
+            self.graph_journal (GraphJournal): Records the changes that affected the graph.
+        """
+
+        if self.materializer is not None: #inferred triples the changes assert become asserted
+            self.materializer.promote(changes)
+
+        effective_changes = self.graph_journal.apply(changes)
+        self.record_graph_changes(effective_changes)
+
+
+    def rollback_graph(self, savepoint):
+        """
+        Undo the graph changes made since a savepoint of the graph journal.
+
+        Args:
+            savepoint (int): A savepoint returned by `self.graph_journal.savepoint()`.
+
+        Updates:
+            self.or_graph (rdflib.Graph): Restored to its state at the savepoint.
+            self.graph_journal (GraphJournal): The undone changes are dropped.
+        """
+
+        undo_changes = self.graph_journal.rollback(savepoint)
+        self.record_graph_changes(undo_changes)
+
+
+    def revert_steps(self, count=1):
+        """
+        Undo the sensor updates of the last steps, in O(delta).
+
+        Only the ontology graph is restored; the position in the procedure is not changed.
+
+        Args:
+            count (int, optional): Number of steps to revert, at most the number of steps since
+                the journal was last committed. Defaults to 1.
+
+        Updates:
+            self.or_graph (rdflib.Graph): Restored to its state before the sensor update of the
+                count-th last step.
+            self.step_savepoints (list): The savepoints of the reverted steps are dropped.
+        """
+
+        if not 0 < count <= len(self.step_savepoints):
+            raise ValueError(f"Cannot revert {count} steps; {len(self.step_savepoints)} can be reverted.")
+
+        savepoint = self.step_savepoints[-count]
+        del self.step_savepoints[-count:]
+        self.step_savepoint = savepoint
+        self.rollback_graph(savepoint)
+
+
+    def commit_graph_changes(self):
+        """
+        Accept the changes made so far: earlier steps can no longer be reverted.
+
+        Called when the procedure ends; the journal, which keeps every step's changes (each
+        coalesced to one change per triple) so that several steps can be reverted, is emptied.
+
+        Updates:
+            self.graph_journal (GraphJournal): Committed.
+            self.step_savepoint (int): Set to the current state.
+            self.step_savepoints (list): Cleared.
+        """
+
+        self.graph_journal.commit()
+        self.step_savepoint = self.graph_journal.savepoint()
+        self.step_savepoints = []
+
+
+    def record_graph_changes(self, changes):
+        """
+        Keep the graph delta and the caches derived from the graph consistent with applied changes.
+
+        Args:
+            changes (list): The (action, triple) pairs that were applied to the graph.
+
+        Updates:
+            self.or_graph (rdflib.Graph): The consequences of the changes are materialized, if enabled.
+            self.graph_version (int): Bumped if the graph changed.
+            self.graph_delta (list): Extended with the (action, triple) pairs, and coalesced to one
+                per triple whenever it doubles in length (e.g. while sensor data is streamed without
+                validation).
+            self.step_action_table (dict): Invalidated if a step action changed.
+            self.procedure_index (ProcedureIndex): Invalidated if the procedure structure changed.
+            self.step_profiles (StepResourceProfiles): Updated with the changes, if built.
+            self.inferred_graph (InferredDataGraph): Records the changes, if enabled.
+        """
+
+        if self.materializer is not None:
+            changes = changes + self.materializer.update(changes)
+
+        if changes:
+            self.graph_version += 1
+
+        self.graph_delta.extend(changes)
+        if len(self.graph_delta) >= self.graph_delta_limit:
+            self.graph_delta = coalesce_changes(self.graph_delta)
+            self.graph_delta_limit = max(COALESCE_SIZE, 2 * len(self.graph_delta))
+
+        if self.inferred_graph is not None:
+            self.inferred_graph.record(changes)
+
+        changed_predicates = {triple[1] for _, triple in changes}
+
+        if OR.stepAction in changed_predicates:
+            self.step_action_table = None
+        if changed_predicates & STRUCTURAL_PREDICATES:
+            self.procedure_index = None
+        if self.step_profiles is not None:
+            self.step_profiles.update(self.or_graph, changes)
+
+
+    def get_graph_changes(self):
+        """
+        Get the changes of the ontology graph relative to the loaded (materialized) ontology.
+
+        Args:
+            None
+
+        Returns:
+            list: (action, triple) pairs, at most one per triple.
+        """
 
-                for triple in triples:
-                    triple = parse_json_to_rdflib(triple, OR)
+        if isinstance(self.or_graph.store, OverlayStore):
+            #an overlay may be layered over a shared overlay (e.g. the materialized base graph)
+            changes = []
+            store = self.or_graph.store
+            while isinstance(store, OverlayStore):
+                changes = store.changes() + changes
+                store = store.base_graph.store
+            return coalesce_changes(changes)
+        if self.materializer is not None: #the journal only holds the asserted changes
+            return self.graph_journal.net_changes() + [("add", triple) for triple in self.materializer.inferred]
+        return self.graph_journal.net_changes()
 
-                    act = step_data.get("action")
 
-                    if act == "add":
-                        self.or_graph.add(triple)
-                    elif act == "remove":
-                        self.or_graph.remove(triple)      
+    def get_procedure_index(self):
+        """
+        Get the procedure navigation index, (re)building it from the ontology graph if needed.
+
+        Args:
+            None
+
+        Returns:
+            ProcedureIndex: The index of the current ontology graph.
+
+        Updates:
+            self.procedure_index (ProcedureIndex): Built if it was not available.
+        """
+
+        if self.procedure_index is None:
+            self.procedure_index = ProcedureIndex(self.or_graph)
+        return self.procedure_index
+
+
+    def get_step_profiles(self):
+        """
+        Get the per-step resource profiles, building them from the ontology graph if needed.
+
+        Args:
+            None
+
+        Returns:
+            StepResourceProfiles: The profiles of the current ontology graph.
+
+        Updates:
+            self.step_profiles (StepResourceProfiles): Built if it was not available.
+        """
+
+        if self.step_profiles is None:
+            self.step_profiles = StepResourceProfiles(self.or_graph)
+        return self.step_profiles
 
 
     def respond_to_violation(self):
@@ -98,14 +352,14 @@ class ORSimulator:
                 description = step_data.get("description", None)
                 
                 if message is not None:
-                    response = input(message).strip().lower()
+                    response = self.prompt(message).strip().lower()
 
                     if description in ("Step failure check", "Alignment check step", "Block positioning step"):
                         affirming_help_msg = step_data.get("affirming help message", None)
 
                         if "yes" in response:
                             print(affirming_help_msg)
-                            time.sleep(2)
+                            self.pause(2)
                         else:
                             print("Please try again.")
                         
@@ -114,35 +368,21 @@ class ORSimulator:
         """
         Restore the ontology graph to a non-violation state.
 
-        Reverses the actions that caused the violation by either adding or 
-        removing triples in the ontology graph. Resets the violation flag 
-        and confirms the issue has been resolved.
+        Rolls the graph journal back to the savepoint taken before the current 
+        steps' sensor update, undoing exactly the changes that caused the violation. 
+        Resets the violation flag and confirms the issue has been resolved.
 
         Args:
             None
 
         Updates:
             self.or_graph (rdflib.Graph): Restored to a consistent state.
+            self.graph_delta (list): Extended with the reversed (action, triple) pairs.
             self.violation_occurred (bool): Set to False after processing.                
         """
     
-        for step_ID in self.current_steps:
-            #Extract data relevant to a step
-            step_data = self.sensor_data.get(step_ID, None)
-
-            if step_data is not None:
-                triples = step_data.get("triples", [])
-
-                for triple in triples:
-                    triple = parse_json_to_rdflib(triple, OR)
-
-                    act = step_data.get("action")
-
-                    #reverse the action to fix the validation report
-                    if act == "add":
-                        self.or_graph.remove(triple)
-                    elif act == "remove":
-                        self.or_graph.add(triple)
+        #undo the sensor update to fix the validation report
+        self.rollback_graph(self.step_savepoint)
 
         self.violation_occurred = False
 
@@ -176,10 +416,11 @@ class ORSimulator:
     
         #trigger an action if validation report is not empty
         if not is_valid:
-            self.violation_occurred = True
-            self.respond_to_violation()
-            self.post_violation_processing()
-            is_valid, validation_report = self.validate()
+            with self.metrics.span("violation_round_trip"):
+                self.violation_occurred = True
+                self.respond_to_violation()
+                self.post_violation_processing()
+                is_valid, validation_report = self.validate()
         
         step_actions = self.get_step_actions(self.current_steps)
 
@@ -190,13 +431,56 @@ class ORSimulator:
 
         print("Current step{}finished.\n[Press 'Tab' to proceed; '?' to ask another question; 'esc' to exit the simulation.]".format(str(step_action_msg)))
 
+        if self.prefetch:
+            self.start_lookahead()
+
 
     def validate(self):
         """
         Validate the ontology graph against SHACL shapes.
 
         Uses SHACL rules to check if the ontology graph conforms to its constraints.
-        Returns whether the graph conforms and a detailed validation report.
+        Returns whether the graph conforms and a detailed validation report. In incremental
+        validation mode, once the graph is known to conform, only the shapes and focus nodes
+        touched by the graph delta since the last validation are re-checked. The report of a
+        violation is only produced if it is shown (show_validation_report).
+
+        Args:
+            None
+
+        Returns:
+            tuple:
+                conforms (bool): True if the graph conforms to the SHACL rules, False otherwise.
+                validation_report (str): A human-readable report detailing validation results,
+                    or None for a violation whose report is not shown.
+
+        Updates:
+            self.graph_delta (list): Cleared, as the delta has been validated.
+            self.last_validation_conforms (bool): Set to the validation outcome.
+        """
+
+        with self.metrics.span("validate"):
+            if self.incremental_validation and self.last_validation_conforms:
+                is_valid, validation_report = self.validate_delta()
+            else:
+                is_valid, validation_report = self.validate_full()
+
+        self.graph_delta = []
+        self.last_validation_conforms = is_valid
+
+        return is_valid, validation_report
+
+
+    def validate_delta(self):
+        """
+        Validate only what the graph delta since the last (conforming) validation may have affected.
+
+        Re-checks the shapes whose predicates or targets are touched by the delta, restricted
+        to the touched focus nodes (scoped ahead of time by the lookahead when the delta is the
+        one it predicted). Falls back to full validation when the delta cannot be
+        scoped (e.g. schema changes). A violation of the scoped shapes is a violation of the
+        whole graph; only if its report is shown is the whole graph validated again, so that
+        the report is identical to that of full validation.
 
         Args:
             None
@@ -207,26 +491,86 @@ class ORSimulator:
                 validation_report (str): A human-readable report detailing validation results.
         """
 
-        is_valid, _, validation_report = validate(self.or_graph, #TODO: can add a distinction between data graph and schema graph
-        shacl_graph= self.shacl_shapes_graph,
-        ont_graph=None,
-        inference='rdfs',
-        abort_on_first=False,
-        allow_infos=False,
-        allow_warnings=False,
-        meta_shacl=False,
-        advanced=False,
-        js=False,
-        debug=False)
+        lookahead = self.lookahead
+        if lookahead is not None and lookahead.validation_version == self.graph_version and lookahead.validation_delta == self.graph_delta:
+            scoped_shapes_graph = lookahead.scoped_shapes_graph
+        else:
+            scoped_shapes_graph = get_scoped_shapes_graph(self.shacl_shapes_graph, self.or_graph, self.graph_delta, self.shape_predicates)
+
+        if scoped_shapes_graph is None:
+            return self.validate_full()
+
+        if len(scoped_shapes_graph) == 0: #nothing the delta touched is constrained
+            return True, CONFORMING_REPORT
+
+        is_valid, validation_report = self.validate_full(scoped_shapes_graph, report=False)
+
+        if not is_valid and self.show_validation_report: #report the violation exactly as full validation would
+            return self.validate_full()
 
         return is_valid, validation_report
 
 
+    def validate_full(self, shacl_shapes_graph=None, report=None):
+        """
+        Validate the whole ontology graph against SHACL shapes with pyshacl.
+
+        With separate schema validation enabled, the incrementally maintained RDFS expansion 
+        of the graph is validated directly, so pyshacl neither copies nor re-expands it.
+        With native validation enabled, the compiled shapes are checked with direct triple 
+        probes first and pyshacl only runs for the shapes that could not be compiled, or to 
+        produce the report once a violation is found (if the report is needed).
+
+        Args:
+            shacl_shapes_graph (rdflib.Graph, optional): Shapes to validate against. Defaults
+                to all loaded SHACL shapes.
+            report (bool, optional): Whether the report of a violation is needed; without it,
+                only whether the graph conforms is determined as cheaply as possible. Defaults
+                to self.show_validation_report.
+
+        Returns:
+            tuple:
+                conforms (bool): True if the graph conforms to the SHACL rules, False otherwise.
+                validation_report (str): A human-readable report detailing validation results,
+                    or None if a violation was found and no report was needed.
+        """
+
+        if shacl_shapes_graph is None:
+            shacl_shapes_graph = self.shacl_shapes_graph
+        if report is None:
+            report = self.show_validation_report
+
+        if self.inferred_graph is not None:
+            self.inferred_graph.update(self.or_graph)
+            data_graph, inference = self.inferred_graph.graph, 'none'
+        else:
+            data_graph, inference = self.or_graph, 'rdfs'
+
+        if self.compiled_shapes is not None:
+            if shacl_shapes_graph is self.shacl_shapes_graph:
+                compiled_shapes = self.compiled_shapes
+            else:
+                compiled_shapes = CompiledShapes(shacl_shapes_graph)
+
+            if not compiled_shapes.conforms(data_graph):
+                if not report:
+                    return False, None
+            elif len(compiled_shapes.fallback_shapes_graph) == 0:
+                return True, CONFORMING_REPORT
+            else:
+                is_valid, validation_report = run_pyshacl(data_graph, compiled_shapes.fallback_shapes_graph, inference)
+                if is_valid or not report:
+                    return is_valid, validation_report
+
+        return run_pyshacl(data_graph, shacl_shapes_graph, inference)
+
+
     def proceed_to_next_step(self):
         """
         Advance to the next step(s) in the current phase.
 
-        Retrieves the next steps through a SPARQL query and updates the simulation's
+        Retrieves the next steps from the procedure index (or from the lookahead, if it was
+        computed for the current position and graph) and updates the simulation's
         state. If there are no more steps, flags the procedure for termination. Otherwise,
         updates the current steps and displays a message indicating the next steps.
 
@@ -241,15 +585,17 @@ class ORSimulator:
             Prints a message indicating the next steps or the end of the phase.
         """
 
-        next_steps = self.get_next_steps(self.current_steps)
+        lookahead = self.get_lookahead()
+        next_steps = self.get_next_steps(self.current_steps) if lookahead is None else lookahead.next_steps
         
         if len(next_steps) == 0: # If there are no steps to perform, move to next phase or end the procedure
-            if self.is_final_phase() == True:
+            if (self.is_final_phase() if lookahead is None else lookahead.is_final_phase) == True:
                 print("No more steps needed. The final phase is complete. The procedure is finished.")
                 self.ongoing_procedure = False
+                self.commit_graph_changes()
                 self.stop_listener()
             else:
-                self.proceed_to_next_phase()
+                self.proceed_to_next_phase(None if lookahead is None else lookahead.next_phase_rows)
         else:        
             #Update
             self.current_steps = next_steps
@@ -259,8 +605,8 @@ class ORSimulator:
         """
         Retrieve the next steps in the procedure.
 
-        Executes a SPARQL query to determine the next steps based on the given 
-        current steps. Converts the query result into a list of step labels.
+        Looks up the next steps of the given current steps in the procedure index. 
+        Converts the result into a list of step labels.
 
         Args:
             current_steps (list): The current steps being executed in the procedure.
@@ -269,23 +615,24 @@ class ORSimulator:
             list: A list of labels representing the next steps in the procedure.
         """
     
-        query_result = list(self.or_graph.query(queries.get_next_steps(current_steps)))
+        query_result = self.get_procedure_index().get_next_steps(current_steps)
         next_steps = query_result_to_list(query_result)
 
         return next_steps
         
 
-    def proceed_to_next_phase(self):
+    def proceed_to_next_phase(self, next_phase_rows=None):
         """
         Transition to the next phase of the simulation.
 
-        Executes a SPARQL query to retrieve the next phase and its details, 
+        Looks up the next phase and its details in the procedure index, 
         including the initial steps. Updates the current phase and initializes 
         the first steps of the new phase. Displays information about the transition 
         from the current phase to the next.
 
         Args:
-            None
+            next_phase_rows (list, optional): The next phase rows, if already looked up.
+                Defaults to None.
 
         Updates:
             self.current_phase (str): Set to the next phase of the procedure.
@@ -296,13 +643,14 @@ class ORSimulator:
             transition, and the initialized steps of the new phase.
         """
 
-        query_result = self.or_graph.query(queries.get_next_phase_and_phase_order_no(self.current_phase, self.current_plan))
+        if next_phase_rows is None:
+            next_phase_rows = self.get_procedure_index().get_next_phase_and_phase_order_no(self.current_phase, self.current_plan)
         first_steps = []
 
         current_phase_task = self.get_phase_task(get_label_from_uri(self.current_phase))
         print(f"Current phase ({current_phase_task}), is complete.\n\n")
         
-        for row in query_result:
+        for row in next_phase_rows:
             next_phase_task = self.get_phase_task(get_label_from_uri(row.next_phase))
             print(f"Proceeding from phase {row.current_phase_no} to phase {row.next_phase_no}, namely {next_phase_task}.")
             self.current_phase = get_label_from_uri(row.next_phase)
@@ -322,7 +670,7 @@ class ORSimulator:
         """
         Retrieve the task label associated with a specific phase.
 
-        Executes a SPARQL query to find the task corresponding to the given phase 
+        Looks up the task corresponding to the given phase in the procedure index 
         and returns its label.
 
         Args:
@@ -332,9 +680,8 @@ class ORSimulator:
             str: The label of the task associated with the phase, or None if no task is found.
         """
 
-        query_result = self.or_graph.query(queries.get_phase_task(phase))
-        for row in query_result:
-            task = get_label_from_uri(row.task).replace("_", " ")
+        for task_uri in self.get_procedure_index().get_phase_tasks(phase):
+            task = get_label_from_uri(task_uri).replace("_", " ")
         return task
 
 
@@ -342,7 +689,8 @@ class ORSimulator:
         """
         Retrieve the actions associated with specific steps.
 
-        Executes a SPARQL query to determine the actions required for the given steps 
+        Looks the steps up in the step action table, which is built with a single SPARQL 
+        query over all steps on first use and rebuilt only after a step action changes, 
         and returns their labels as a list.
 
         Args:
@@ -352,12 +700,17 @@ class ORSimulator:
             list: A list of action labels associated with the given steps.
         """
 
+        if self.step_action_table is None:
+            step_action_table = {}
+            for row in queries.get_all_step_actions(self.or_graph):
+                actions = step_action_table.setdefault(get_label_from_uri(row.step), [])
+                actions.append(get_label_from_uri(row.action).replace("_", " "))
+            self.step_action_table = step_action_table
+
         step_actions = []
         
         for step in steps:
-            query_result = self.or_graph.query(queries.get_step_action(step))
-            for row in query_result:
-                step_actions.append(get_label_from_uri(row.action).replace("_", " "))
+            step_actions.extend(self.step_action_table.get(step, []))
         
         return step_actions
 
@@ -425,7 +778,7 @@ class ORSimulator:
         """
         Check if the current phase is the final phase.
 
-        Executes a SPARQL query to determine whether the current phase is the last 
+        Looks up in the procedure index whether the current phase is the last 
         phase in the procedure.
 
         Args:
@@ -435,8 +788,7 @@ class ORSimulator:
             obol: True if the current phase is the final phase, False otherwise.
         """
 
-        query = queries.is_final_phase(self.current_phase)
-        is_last_phase = bool(self.or_graph.query(query))
+        is_last_phase = self.get_procedure_index().is_final_phase(self.current_phase)
         return is_last_phase
     
 
@@ -462,37 +814,142 @@ class ORSimulator:
         """
         Handle key press events during the simulation.
 
-        Processes key presses to control the simulation, including progressing to 
-        the next step or phase, entering question mode, or terminating the procedure.
+        Translates key presses into simulation events: progressing to the next step 
+        or phase, entering question mode, or terminating the procedure. The events are 
+        handled by the simulation loop, so this listener thread never blocks on them.
 
         Args:
             key (keyboard.Key or keyboard.KeyCode): The key press event to process.
 
         Updates:
-            self.ongoing_procedure (bool): Set to False if the procedure is terminated.
-
-        Outputs:
-            Prints messages based on user actions, such as termination or entering question mode.
+            self.events (queue.Queue): The event triggered by the key is queued.
         """
 
         try:
             if key == keyboard.Key.esc:
-                self.ongoing_procedure = False
-                print("\nProcedure terminated.") 
-                self.stop_listener()
+                self.post_event("terminate")
                 return False
             
             if self.in_question_mode:
                 return
             
             if key == keyboard.Key.tab and self.ongoing_procedure and not self.violation_occurred: #to the next step/phase
-                self.advance_simulation()
+                self.post_event("advance")
             elif key.char == '?' and not self.violation_occurred and not self.in_question_mode:
-                self.ask_question()
+                self.post_event("question")
         except AttributeError:
             pass
 
 
+    def post_event(self, event, payload=None):
+        """
+        Queue an event for the simulation loop.
+
+        Input threads (the keyboard listener, sensor feeds) only post events; all reasoning,
+        validation and user interaction happens when the simulation loop handles them.
+
+        Args:
+            event (str): "advance", "question", "sensor", "validate", "validation_result" or "terminate".
+            payload (optional): Event data; for "sensor" events a list of (action, triple) pairs,
+                for "validation_result" events a (conforms, validation report) tuple.
+
+        Updates:
+            self.events (queue.Queue): The event is appended.
+        """
+
+        self.events.put((event, payload))
+
+
+    def handle_event(self, event, payload=None):
+        """
+        Handle an event from the event queue.
+
+        Args:
+            event (str): "advance", "question", "sensor", "validate", "validation_result" or "terminate".
+            payload (optional): Event data; for "sensor" events a list of (action, triple) pairs,
+                for "validation_result" events a (conforms, validation report) tuple (conforms
+                is None if the validation failed, the report then says why).
+
+        Updates:
+            self.ongoing_procedure (bool): Set to False if the procedure is terminated.
+            self.or_graph (rdflib.Graph): Updated by "advance" and "sensor" events.
+
+        Outputs:
+            Prints messages based on user actions, such as termination or entering question mode.
+        """
+
+        self.wait_for_lookahead() #never change the graph while the lookahead reads it
+
+        if event == "terminate":
+            self.ongoing_procedure = False
+            print("\nProcedure terminated.")
+            self.commit_graph_changes()
+            self.stop_listener()
+        elif event == "advance" and self.ongoing_procedure and not self.violation_occurred:
+            self.advance_simulation()
+        elif event == "question" and not self.violation_occurred and not self.in_question_mode:
+            self.ask_question()
+        elif event == "sensor":
+            self.apply_graph_changes(payload)
+        elif event == "validate" and self.validation_service is not None:
+            try:
+                future = self.validation_service.submit_simulator(self)
+            except Exception as error: #e.g. the service's worker pool is broken
+                future = Future()
+                future.set_exception(error)
+            future.add_done_callback(self.post_validation_result)
+        elif event == "validate":
+            self.handle_event("validation_result", self.validate())
+        elif event == "validation_result":
+            is_valid, validation_report = payload
+            if is_valid is None:
+                print(f"The streamed sensor data could not be validated: {validation_report}")
+            elif not is_valid:
+                print("The streamed sensor data violates the procedure constraints.")
+                if self.show_validation_report:
+                    print(validation_report)
+
+
+    def post_validation_result(self, future):
+        """
+        Post the result of an asynchronous validation as a "validation_result" event.
+
+        Called when the validation service's future is done, in a thread of the service. A
+        failed validation (e.g. a worker process that died) is posted as a result whose
+        conforms flag is None, so the failure is reported rather than lost in the thread.
+
+        Args:
+            future (concurrent.futures.Future): The validation's (conforms, validation report) result.
+        """
+
+        try:
+            result = future.result()
+        except Exception as error:
+            result = (None, f"Validation failed ({type(error).__name__}: {error})")
+        self.post_event("validation_result", result)
+
+
+    def start_sensor_stream(self, lines, **stream_options):
+        """
+        Start ingesting a live feed of newline-delimited JSON sensor messages.
+
+        The feed is read and coalesced into batched "sensor" events (and periodic "validate"
+        events) in the background; the simulation loop applies them to the ontology graph.
+
+        Args:
+            lines (iterable): Source of the messages, e.g. a pipe, a socket file object or
+                `sensor_stream.follow_file(path)`.
+            **stream_options: Batching and validation cadence options of SensorStream.
+
+        Returns:
+            SensorStream: The running stream.
+        """
+
+        stream = SensorStream(self, lines, **stream_options)
+        stream.start()
+        return stream
+
+
     def advance_simulation(self):
         """
         Advance the simulation workflow to the next step or phase.
@@ -504,6 +961,8 @@ class ORSimulator:
         4. Validating the updated ontology and addressing any violations.
 
         Ensures the simulation continues as long as the procedure remains active.
+        The latency of each stage is recorded in `self.metrics`; the advance is profiled
+        with cProfile if requested with `profile_next_advance`.
 
         Args:
             None
@@ -518,14 +977,122 @@ class ORSimulator:
             phase transitions and any updates to the ontology.
         """
 
-        #After handling the sensor data and validation,
-        #proceed to the next step (or phase if no more steps in current phase)
-        self.proceed_to_next_step()
+        if self.profile_path is not None:
+            profile_path, self.profile_path = self.profile_path, None
+            with profile(profile_path):
+                self.advance_simulation()
+            return
+
+        with self.metrics.span("advance"):
+            #After handling the sensor data and validation,
+            #proceed to the next step (or phase if no more steps in current phase)
+            with self.metrics.span("proceed_to_next_step"):
+                self.proceed_to_next_step()
+
+            if self.ongoing_procedure:
+                with self.metrics.span("progress_message"):
+                    self.progress_message()
+                with self.metrics.span("sensor_update"):
+                    self.simulate_robotic_sensor_output_and_update_ontology()
+                with self.metrics.span("process_sensor_data_and_advance"):
+                    self.process_sensor_data_and_advance()
+
+
+    def start_lookahead(self):
+        """
+        Start computing the lookahead for the next advance in the background.
+
+        Args:
+            None
+
+        Updates:
+            self.lookahead (Lookahead): Cleared, then set once computed.
+            self.lookahead_thread (threading.Thread): The thread computing it.
+        """
+
+        self.wait_for_lookahead()
+        self.lookahead = None
+        self.lookahead_thread = threading.Thread(target=self.run_lookahead, daemon=True)
+        self.lookahead_thread.start()
+
+
+    def run_lookahead(self):
+        """
+        Compute the lookahead for the next advance (run by the lookahead thread).
+
+        The lookahead is speculative: if computing it fails, the next advance simply does 
+        without it.
 
-        if self.ongoing_procedure:
-            self.progress_message()
-            self.simulate_robotic_sensor_output_and_update_ontology()
-            self.process_sensor_data_and_advance()
+        Args:
+            None
+
+        Updates:
+            self.lookahead (Lookahead): The speculative results, or None.
+        """
+
+        try:
+            with self.metrics.span("lookahead"):
+                self.lookahead = compute_lookahead(self)
+        except Exception:
+            self.lookahead = None
+
+
+    def wait_for_lookahead(self):
+        """
+        Wait until the lookahead thread, if any, has finished.
+
+        Args:
+            None
+
+        Updates:
+            self.lookahead_thread (threading.Thread): Cleared.
+        """
+
+        if self.lookahead_thread is not None:
+            self.lookahead_thread.join()
+            self.lookahead_thread = None
+
+
+    def get_lookahead(self):
+        """
+        Get the lookahead for the advance from the current position, if it is still valid.
+
+        The lookahead is discarded if the position or the graph changed since it was 
+        computed (e.g. by a sensor update).
+
+        Args:
+            None
+
+        Returns:
+            Lookahead: The speculative results, or None if there are none (or no longer valid ones).
+
+        Updates:
+            self.lookahead (Lookahead): Cleared if it is no longer valid.
+        """
+
+        self.wait_for_lookahead()
+        lookahead = self.lookahead
+
+        if lookahead is not None and (lookahead.graph_version != self.graph_version
+                                      or lookahead.current_steps != self.current_steps
+                                      or lookahead.current_phase != self.current_phase):
+            self.lookahead = lookahead = None
+
+        return lookahead
+
+
+    def profile_next_advance(self, output_path):
+        """
+        Capture a cProfile profile of the next advance to the next step or phase.
+
+        Args:
+            output_path (str): Path of the file to save the profile statistics to (readable with `pstats`).
+
+        Updates:
+            self.profile_path (str): Set until the next advance has been profiled.
+        """
+
+        self.profile_path = output_path
 
     
     def ask_question(self):
@@ -554,13 +1121,14 @@ class ORSimulator:
             self.listener.stop()
 
         display_question_menu()
-        question = input('What is your question?\n').strip().lower()
+        question = self.prompt('What is your question?\n').strip().lower()
         question_mode(self, question)
 
         self.in_question_mode = False
         print("[Press 'Tab' to proceed; '?' to ask another question; 'esc' to exit the simulation.]\n")
         
-        self.setup_keyboard_listeners() #restart the listener after question mode done
+        if self.listener:
+            self.setup_keyboard_listeners() #restart the listener after question mode done
 
 
     def stop_listener(self):
@@ -581,13 +1149,33 @@ class ORSimulator:
             self.listener.stop()
 
 
+    def start_procedure(self):
+        """
+        Execute the first step(s) of the procedure.
+
+        Displays the progress message for the initial steps, simulates their sensor data 
+        and validates the updated ontology.
+
+        Args:
+            None
+
+        Updates:
+            self.or_graph (rdflib.Graph): Modified during sensor data simulation.
+        """
+
+        self.progress_message(intro=True)      
+        self.simulate_robotic_sensor_output_and_update_ontology() #simulate sensor data
+        self.process_sensor_data_and_advance() 
+
+
     def run_simulation(self):
         """
         Run the simulation.
 
         Starts the simulation by setting up the keyboard listeners and displaying 
-        the introductory message. Continuously processes user interactions and 
-        simulation updates until the procedure is completed or terminated.
+        the introductory message. Then handles the queued key, sensor and question 
+        events one at a time until the procedure is completed or terminated; the 
+        loop blocks on the event queue, so it wakes only when there is work to do.
 
         Args:
             None
@@ -604,11 +1192,50 @@ class ORSimulator:
         self.setup_keyboard_listeners()
 
         #execute first step. Later, proceeding to next steps is triggered by pressing a 'Tab' key
-        self.progress_message(intro=True)      
-        self.simulate_robotic_sensor_output_and_update_ontology() #simulate sensor data
-        self.process_sensor_data_and_advance() 
+        self.start_procedure()
 
         while self.ongoing_procedure:
-            time.sleep(0.1) #for performance
+            event, payload = self.events.get()
+            self.handle_event(event, payload)
+
+        self.stop_listener()
+
+        if self.metrics_path is not None:
+            self.metrics.dump(self.metrics_path)
+
+
+def prepare_base_graph(base_graph, simulator_options):
+    """
+    Precompute the inferences that simulators layered over a shared base graph can share.
+
+    With incremental reasoning, the base graph is materialized once, in an overlay; the
+    simulators' materializers start from its inferred triples. With separate schema, native or
+    incremental validation, the RDFS closure of the (materialized) base graph is computed
+    once; the simulators only keep their changes of it. Every simulator then costs memory
+    proportional to its changes rather than to the ontology.
+
+    With compact_store, the base graph (if not compact yet) and its closure are kept in
+    CompactStores. The triples the materialization adds stay in an overlay and a set.
+
+    Args:
+        base_graph (rdflib.Graph): The shared, read-only ontology graph.
+        simulator_options (dict): The ORSimulator options of the simulators.
+
+    Returns:
+        dict: The ORSimulator arguments "base_graph", "base_inferred" and "base_closure".
+    """
+
+    compact = simulator_options.get("compact_store", False)
+    if compact and not isinstance(base_graph.store, CompactStore):
+        base_graph = Graph(store=CompactStore(base_graph))
+
+    base_inferred = None
+    if simulator_options.get("incremental_reasoning"):
+        base_graph = overlay_graph(base_graph)
+        base_inferred = IncrementalMaterializer(base_graph).inferred
+
+    base_closure = None
+    if any(simulator_options.get(option) for option in ("separate_schema_validation", "native_validation", "incremental_validation")):
+        base_closure = InferredDataGraph(base_graph, compact=compact)
 
-        self.stop_listener()
\ No newline at end of file
+    return {"base_graph": base_graph, "base_inferred": base_inferred, "base_closure": base_closure}
@@ -0,0 +1,373 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import rdflib
+import pyshacl
+from rdflib import Graph, Namespace
+
+#local imports
+import queries
+from ontology_utils import load_and_materialize_ontology
+from synthetic_ontology import generate_synthetic_ontology
+from replay import ProcedureReplayer
+from OR_simulator import ORSimulator
+from compact_store import CompactStore
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+#Individuals bound to the parameters of each query (all of them exist in every synthetic ontology)
+QUERY_BINDINGS = {
+    "next_steps": {"current_step": "Step_A1_1"},
+    "next_phase_and_phase_order_no": {"current_phase": "A_Phase1", "current_plan": "PlanA"},
+    "phase_task": {"phase": "A_Phase1"},
+    "step_action": {"step": "Step_A1_1"},
+    "is_final_phase": {"current_phase": "A_Phase5"},
+    "tools_for_steps": {"step": "Step_A1_1"},
+    "actors_for_steps": {"step": "Step_A1_1"},
+    "capabilities_for_steps": {"step": "Step_A1_1"},
+    "materials_for_steps": {"step": "Step_A1_1"},
+}
+
+#ORSimulator options of the validation modes
+VALIDATION_MODES = {
+    "full": {},
+    "incremental": {"incremental_validation": True},
+    "separate_schema": {"separate_schema_validation": True},
+    "native": {"native_validation": True, "incremental_validation": True},
+}
+
+
+def summarize(timings):
+    """
+    Summarize the timings of repeated runs.
+
+    Args:
+        timings (list): Durations in seconds.
+
+    Returns:
+        dict: Number of runs and the minimum, median, mean and maximum duration in seconds.
+    """
+
+    return {
+        "runs": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "max": max(timings),
+    }
+
+
+def time_call(function, repeat):
+    """
+    Time repeated calls of a function.
+
+    Args:
+        function (callable): The function to call without arguments.
+        repeat (int): Number of calls.
+
+    Returns:
+        dict: The summary of the timings (see `summarize`).
+    """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def materialize(ontology_path, reasoner, output_path):
+    """
+    Load and materialize an ontology without caching and save the result (run in a subprocess,
+    so every run starts from a fresh owlready2 world).
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        reasoner (str): "hermit", "pellet" or "python".
+        output_path (str): Path of the N-Triples file to save the materialized graph to.
+
+    Returns:
+        tuple: Seconds spent in `load_and_materialize_ontology` and the number of triples.
+    """
+
+    start = time.perf_counter()
+    graph = load_and_materialize_ontology(ontology_path, reasoner=reasoner)
+    elapsed = time.perf_counter() - start
+
+    graph.serialize(output_path, format="nt", encoding="utf-8")
+    return elapsed, len(graph)
+
+
+def benchmark_materialization(ontology_path, reasoners, repeat, output_dir):
+    """
+    Time `load_and_materialize_ontology` for each reasoner.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        reasoners (list): Reasoners to compare.
+        repeat (int): Runs per reasoner.
+        output_dir (str): Directory to save the materialized graphs to.
+
+    Returns:
+        tuple:
+            results (dict): Reasoner -> timing summary and triple count, or the error raised.
+            materialized_paths (dict): Reasoner -> path of its materialized graph, for the
+                reasoners that succeeded.
+    """
+
+    results = {}
+    materialized_paths = {}
+
+    for reasoner in reasoners:
+        output_path = os.path.join(output_dir, reasoner + ".nt")
+        timings = []
+        try:
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    elapsed, triple_count = executor.submit(materialize, ontology_path, reasoner, output_path).result()
+                timings.append(elapsed)
+        except Exception as error: #e.g. no Java runtime for the reasoner
+            results[reasoner] = {"error": "{}: {}".format(type(error).__name__, error)}
+            continue
+
+        results[reasoner] = dict(summarize(timings), triples=triple_count)
+        materialized_paths[reasoner] = output_path
+
+    return results, materialized_paths
+
+
+def benchmark_queries(graph, repeat):
+    """
+    Time every query of `queries.py` through `or_graph.query`.
+
+    Args:
+        graph (rdflib.Graph): The materialized ontology graph.
+        repeat (int): Runs per query.
+
+    Returns:
+        dict: Query name -> timing summary and number of result rows.
+    """
+
+    results = {}
+
+    for query_name in queries.QUERIES:
+        bindings = QUERY_BINDINGS.get(query_name, {})
+        run = lambda: list(queries.run_query(graph, query_name, **bindings))
+        rows = len(run()) #warm-up
+        results[query_name] = dict(time_call(run, repeat), rows=rows)
+
+    return results
+
+
+def benchmark_sensor_update_and_validation(ontology_path, shacl_shape_path, graph, modes):
+    """
+    Time the sensor update and the validation of every step with sensor data.
+
+    For each step, the step's sensor data is applied with
+    `simulate_robotic_sensor_output_and_update_ontology`, the graph is validated with
+    `validate()`, and the update is rolled back (and validated again, untimed) before the
+    next step.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        graph (rdflib.Graph): The materialized ontology graph.
+        modes (list): Names of the validation modes (see VALIDATION_MODES).
+
+    Returns:
+        dict: "sensor_update" -> timing summary, and "validate" -> mode -> timing summary.
+    """
+
+    sensor_update_timings = []
+    validation_results = {}
+
+    for mode in modes:
+        simulator = ORSimulator(ontology_path, shacl_shape_path, base_graph=graph, **VALIDATION_MODES[mode])
+        simulator.validate()
+        validation_timings = []
+
+        for step_ID in simulator.sensor_changes:
+            simulator.current_steps = [step_ID]
+
+            start = time.perf_counter()
+            simulator.simulate_robotic_sensor_output_and_update_ontology()
+            sensor_update_timings.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            simulator.validate()
+            validation_timings.append(time.perf_counter() - start)
+
+            simulator.rollback_graph(simulator.step_savepoint)
+            simulator.validate()
+
+        validation_results[mode] = summarize(validation_timings)
+
+    return {"sensor_update": summarize(sensor_update_timings), "validate": validation_results}
+
+
+def benchmark_replay(ontology_path, shacl_shape_path, graph, script, modes, repeat):
+    """
+    Time end-to-end replays of a recorded procedure.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        graph (rdflib.Graph): The materialized ontology graph.
+        script (list): The recorded events (see ProcedureReplayer).
+        modes (list): Names of the validation modes (see VALIDATION_MODES).
+        repeat (int): Replays per mode.
+
+    Returns:
+        dict: Mode -> timing summary and number of trace entries.
+    """
+
+    results = {}
+
+    for mode in modes:
+        replayer = ProcedureReplayer(ontology_path, shacl_shape_path, base_graph=graph, **VALIDATION_MODES[mode])
+        trace_length = len(replayer.replay(script))
+        results[mode] = dict(time_call(lambda: replayer.replay(script), repeat), events=trace_length)
+
+    return results
+
+
+def benchmark_memory(ontology_path, shacl_shape_path, graph, modes):
+    """
+    Measure the memory of a simulator in each validation mode, with rdflib's memory store and
+    with the compact store.
+
+    The simulator's ontology graph is built from the materialized graph while memory is
+    traced (a copy in a memory store, or a CompactStore), and the graph is validated once, so
+    the figures include the RDFS closure the validation modes keep (compacted as well with
+    the compact store).
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        graph (rdflib.Graph): The materialized ontology graph.
+        modes (list): Names of the validation modes (see VALIDATION_MODES).
+
+    Returns:
+        dict: Mode -> store ("memory" or "compact") -> traced bytes.
+    """
+
+    results = {}
+
+    for mode in modes:
+        results[mode] = {}
+
+        for store in ("memory", "compact"):
+            gc.collect()
+            tracemalloc.start()
+
+            if store == "compact":
+                base_graph = Graph(store=CompactStore(graph))
+            else:
+                base_graph = Graph()
+                base_graph.addN((s, p, o, base_graph) for s, p, o in graph)
+            simulator = ORSimulator(ontology_path, shacl_shape_path, base_graph=base_graph, compact_store=store == "compact", **VALIDATION_MODES[mode])
+            simulator.validate()
+
+            gc.collect()
+            results[mode][store] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del simulator, base_graph
+
+    return results
+
+
+def run_benchmarks(plans, phases, steps, actors, reasoners, modes, repeat, reasoner_repeat, shacl_shape_path, script_path):
+    """
+    Run the benchmark suite on a synthetic ontology.
+
+    Args:
+        plans, phases, steps, actors (int): Size of the synthetic ontology (see `generate_synthetic_ontology`).
+        reasoners (list): Reasoners to compare.
+        modes (list): Validation modes to compare.
+        repeat (int): Runs per query and per replay.
+        reasoner_repeat (int): Runs per reasoner.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        script_path (str): Path to the recorded procedure to replay.
+
+    Returns:
+        dict: The machine-readable results.
+    """
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rdflib": rdflib.__version__,
+            "pyshacl": pyshacl.__version__,
+        },
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        ontology_path = os.path.join(work_dir, "synthetic_ontology.owl")
+
+        start = time.perf_counter()
+        synthetic_graph, individual_count = generate_synthetic_ontology('or_ontology.owl', plans, phases, steps, actors)
+        synthetic_graph.serialize(ontology_path, format="xml")
+        results["ontology"] = {
+            "plans": plans, "phases": phases, "steps": steps, "actors": actors,
+            "synthetic_individuals": individual_count,
+            "triples": len(synthetic_graph),
+            "generation_seconds": time.perf_counter() - start,
+        }
+
+        results["load_and_materialize"], materialized_paths = benchmark_materialization(ontology_path, reasoners, reasoner_repeat, work_dir)
+
+        #the remaining stages run on the first successful materialization, or the unreasoned graph
+        graph = Graph()
+        if materialized_paths:
+            materialized_by = next(reasoner for reasoner in reasoners if reasoner in materialized_paths)
+            graph.parse(materialized_paths[materialized_by], format="nt")
+        else:
+            materialized_by = None
+            graph = synthetic_graph
+        results["ontology"]["materialized_by"] = materialized_by
+        results["ontology"]["materialized_triples"] = len(graph)
+
+        with open(script_path) as file:
+            script = json.load(file)
+
+        results["queries"] = benchmark_queries(graph, repeat)
+        results.update(benchmark_sensor_update_and_validation(ontology_path, shacl_shape_path, graph, modes))
+        results["replay"] = benchmark_replay(ontology_path, shacl_shape_path, graph, script, modes, repeat)
+        results["memory_bytes"] = benchmark_memory(ontology_path, shacl_shape_path, graph, modes)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark loading, reasoning, navigation, sensor updates and validation.")
+    parser.add_argument("--plans", type=int, default=1, help="synthetic plans")
+    parser.add_argument("--phases", type=int, default=5, help="phases per synthetic plan")
+    parser.add_argument("--steps", type=int, default=10, help="steps per synthetic phase")
+    parser.add_argument("--actors", type=int, default=10, help="synthetic actors")
+    parser.add_argument("--reasoners", nargs="+", default=["hermit", "pellet", "python"], help="reasoners to compare")
+    parser.add_argument("--modes", nargs="+", default=["full", "native"], choices=VALIDATION_MODES, help="validation modes to compare")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query and per replay")
+    parser.add_argument("--reasoner-repeat", type=int, default=1, help="runs per reasoner")
+    parser.add_argument("--shapes", default="SHACL_constraints.ttl", help="SHACL shapes file")
+    parser.add_argument("--script", default="replay_script.json", help="recorded procedure to replay")
+    parser.add_argument("--output", help="JSON file to write the results to (default: standard output)")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.plans, arguments.phases, arguments.steps, arguments.actors,
+                             arguments.reasoners, arguments.modes, arguments.repeat, arguments.reasoner_repeat,
+                             arguments.shapes, arguments.script)
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
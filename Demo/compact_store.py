@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from rdflib import Graph
+from rdflib.store import Store
+
+#local imports
+from overlay_store import overlay_graph
+
+#Index name -> positions of the triple terms (0 subject, 1 predicate, 2 object) in its columns
+INDEX_ORDERS = {"spo": (0, 1, 2), "pos": (1, 2, 0), "osp": (2, 0, 1)}
+
+#Bound positions of a triple pattern -> index whose column prefix they form
+PATTERN_INDEXES = {
+    (True, True, True): "spo", (True, True, False): "spo", (True, False, False): "spo", (False, False, False): "spo",
+    (False, True, True): "pos", (False, True, False): "pos",
+    (False, False, True): "osp", (True, False, True): "osp",
+}
+
+
+class CompactStore(Store):
+    """
+    Read-only RDFLib store keeping a graph dictionary-encoded in sorted integer columns.
+
+    Every distinct term is stored once and the triples as term IDs, sorted three ways
+    (SPO, POS and OSP) into `array` columns of 4-byte integers, so a triple costs 36 bytes
+    of index instead of the nested dicts and sets of rdflib's memory store. Any triple
+    pattern is answered by binary searches over the index whose column prefix it binds.
+    Changes are layered on top with an OverlayStore (see `compact_graph`).
+
+    Args:
+        graph (rdflib.Graph): The graph to encode; it is not kept.
+    """
+
+    #a single implicit graph; declared context and graph aware so pyshacl can wrap it in a Dataset
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = True
+
+    def __init__(self, graph):
+
+        super().__init__()
+        self.terms = [] #term ID -> term
+        self.term_ids = {} #term -> term ID
+        self.namespace_bindings = dict(graph.namespaces()) #prefix -> namespace
+
+        encoded_triples = [tuple(self.encode(term) for term in triple) for triple in graph]
+        self.triple_count = len(encoded_triples)
+
+        self.indexes = {} #index name -> its three columns
+        for index_name, order in INDEX_ORDERS.items():
+            encoded_triples.sort(key=lambda triple: tuple(triple[position] for position in order))
+            self.indexes[index_name] = tuple(array("I", (triple[position] for triple in encoded_triples)) for position in order)
+
+
+    def encode(self, term):
+
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+
+    def get_term_id(self, term):
+        return self.term_ids.get(term)
+
+    def get_term(self, term_id):
+        return self.terms[term_id]
+
+
+    def add(self, triple, context=None, quoted=False):
+        raise TypeError("CompactStore is read-only; layer an OverlayStore over it to change the graph.")
+
+    def remove(self, triple_pattern, context=None):
+        raise TypeError("CompactStore is read-only; layer an OverlayStore over it to change the graph.")
+
+
+    def triples(self, triple_pattern, context=None):
+
+        index_name = PATTERN_INDEXES[tuple(term is not None for term in triple_pattern)]
+        columns = self.indexes[index_name]
+        order = INDEX_ORDERS[index_name]
+
+        #the IDs of the bound terms, in column order, form a prefix of the index's sort key
+        key = []
+        for position in order:
+            if triple_pattern[position] is not None:
+                term_id = self.get_term_id(triple_pattern[position])
+                if term_id is None: #a term that does not occur matches nothing
+                    return
+                key.append(term_id)
+
+        start, end = 0, self.triple_count
+        for column, term_id in zip(columns, key):
+            start, end = bisect_left(column, term_id, start, end), bisect_right(column, term_id, start, end)
+
+        get_term = self.get_term
+        first, second, third = columns
+        for row in range(start, end):
+            triple = [None, None, None]
+            triple[order[0]] = get_term(first[row])
+            triple[order[1]] = get_term(second[row])
+            triple[order[2]] = get_term(third[row])
+            yield tuple(triple), iter(())
+
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add_graph(self, graph):
+        pass
+
+    def remove_graph(self, graph):
+        pass
+
+
+    def __len__(self, context=None):
+
+        return self.triple_count
+
+
+    def bind(self, prefix, namespace, override=True):
+        if override or prefix not in self.namespace_bindings:
+            self.namespace_bindings[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self.namespace_bindings.get(prefix)
+
+    def prefix(self, namespace):
+        return next((prefix for prefix, bound in self.namespace_bindings.items() if bound == namespace), None)
+
+    def namespaces(self):
+        return iter(self.namespace_bindings.items())
+
+
+def compact_graph(graph):
+    """
+    Create a writable, dictionary-encoded copy of a graph.
+
+    Args:
+        graph (rdflib.Graph): The graph to copy.
+
+    Returns:
+        rdflib.Graph: A graph over a CompactStore of the graph's triples, with an overlay
+        holding later changes.
+    """
+
+    return overlay_graph(Graph(store=CompactStore(graph)))
@@ -0,0 +1,141 @@
+#local imports
+from ontology_utils import apply_changes, invert_changes, COALESCE_SIZE
+
+
+class GraphJournal:
+    """
+    Journal of the changes applied to a graph, allowing O(delta) rollback.
+
+    Every change applied through the journal is recorded exactly as it affected the graph
+    (no-op additions and removals are not recorded). A savepoint is a position in the
+    journal; rolling back to it undoes precisely the changes recorded after it, without
+    copying or reloading the graph.
+
+    The journal stays bounded: committing forgets the recorded changes, and the changes
+    recorded after the latest savepoint are coalesced to one per triple whenever they double
+    in length (only their net effect matters to rollbacks). The net change of every triple
+    since journaling started is kept up to date separately.
+
+    Args:
+        graph (rdflib.Graph): The graph whose changes are journaled.
+    """
+
+    def __init__(self, graph):
+
+        self.graph = graph
+        self.entries = [] #effective (action, triple) pairs since the last commit, oldest first
+        self.last_savepoint = 0 #latest savepoint handed out
+        self.compaction_limit = COALESCE_SIZE #number of entries after the latest savepoint at which they are coalesced
+        self.net_actions = {} #triple -> its net change since journaling started ("add" or "remove")
+
+
+    def apply(self, changes):
+        """
+        Apply changes to the graph and record the ones that changed it.
+
+        Args:
+            changes (list): (action, triple) pairs.
+
+        Returns:
+            list: The effective (action, triple) pairs.
+        """
+
+        effective_changes = apply_changes(self.graph, changes)
+        self.entries.extend(effective_changes)
+        self.record_net_changes(effective_changes)
+
+        if len(self.entries) - self.last_savepoint >= self.compaction_limit:
+            self.compact()
+
+        return effective_changes
+
+
+    def record_net_changes(self, changes):
+        """
+        Update the net changes with effective changes.
+
+        Args:
+            changes (list): Effective (action, triple) pairs.
+        """
+
+        net_actions = self.net_actions
+        for action, triple in changes:
+            if net_actions.get(triple, action) != action: #back to its state when journaling started
+                del net_actions[triple]
+            else:
+                net_actions[triple] = action
+
+
+    def compact(self):
+        """
+        Coalesce the changes recorded after the latest savepoint into one change per triple.
+
+        The changes of a triple alternate between additions and removals, so its net change
+        is its first change if its last change is the same, and nothing otherwise.
+        """
+
+        first_actions = {}
+        last_actions = {}
+        for action, triple in self.entries[self.last_savepoint:]:
+            first_actions.setdefault(triple, action)
+            last_actions[triple] = action
+
+        self.entries[self.last_savepoint:] = [(action, triple) for triple, action in last_actions.items() if action == first_actions[triple]]
+        self.compaction_limit = max(COALESCE_SIZE, 2 * (len(self.entries) - self.last_savepoint))
+
+
+    def savepoint(self):
+        """
+        Mark the current state of the graph.
+
+        Returns:
+            int: The savepoint, to be passed to `rollback`.
+        """
+
+        self.last_savepoint = len(self.entries)
+        return self.last_savepoint
+
+
+    def rollback(self, savepoint):
+        """
+        Restore the graph to the state it had at a savepoint.
+
+        Args:
+            savepoint (int): A savepoint returned by `savepoint` since the last commit.
+
+        Returns:
+            list: The (action, triple) pairs applied to undo the changes.
+        """
+
+        undo_changes = invert_changes(self.entries[savepoint:])
+        apply_changes(self.graph, undo_changes)
+        del self.entries[savepoint:]
+        self.last_savepoint = min(self.last_savepoint, savepoint)
+        self.record_net_changes(undo_changes)
+        return undo_changes
+
+
+    def net_changes(self):
+        """
+        Summarize the changes since journaling started as one change per triple.
+
+        Applying the net changes to the graph as it was when journaling started gives its
+        current state. Changes cancelling each other out are left out.
+
+        Returns:
+            list: (action, triple) pairs.
+        """
+
+        return [(action, triple) for triple, action in self.net_actions.items()]
+
+
+    def commit(self):
+        """
+        Forget the recorded changes; earlier savepoints can no longer be rolled back to.
+
+        The net changes are kept.
+        """
+
+        self.entries = []
+        self.last_savepoint = 0
+        self.compaction_limit = COALESCE_SIZE
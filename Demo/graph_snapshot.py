@@ -0,0 +1,219 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.store import Store
+
+#local imports
+from compact_store import CompactStore, INDEX_ORDERS
+
+MAGIC = b"TWIN_OR_SNAPv002" #identifies the file format, including the term encoding
+
+#magic, term count, triple count, size of the namespace bindings (JSON)
+HEADER = struct.Struct("<16sQQQ")
+
+
+def encode_term(term):
+    """
+    Encode an RDFLib term as the bytes stored in (and sorted by) a snapshot's term table.
+
+    A literal's datatype and language are stored with their lengths in front, followed by
+    its lexical form, so any character (including NUL) can occur in each of them.
+
+    Args:
+        term (URIRef, BNode or Literal): The term.
+
+    Returns:
+        bytes: The encoded term.
+    """
+
+    if isinstance(term, Literal):
+        datatype = str(term.datatype or "")
+        language = term.language or ""
+        return f"L{len(datatype)}:{datatype}{len(language)}:{language}{term}".encode("utf-8")
+    if isinstance(term, BNode):
+        return ("B" + str(term)).encode("utf-8")
+    return ("U" + str(term)).encode("utf-8")
+
+
+def read_field(text, position):
+    """
+    Read a length-prefixed field of an encoded literal.
+
+    Args:
+        text (str): The decoded term.
+        position (int): Position of the field's length.
+
+    Returns:
+        tuple: The field and the position following it.
+    """
+
+    separator = text.index(":", position)
+    end = separator + 1 + int(text[position:separator])
+    return text[separator + 1:end], end
+
+
+def decode_term(data):
+    """
+    Decode a term encoded with `encode_term`.
+
+    Args:
+        data (bytes): The encoded term.
+
+    Returns:
+        URIRef, BNode or Literal: The term.
+    """
+
+    text = data.decode("utf-8")
+    if text[0] == "L":
+        datatype, position = read_field(text, 1)
+        language, position = read_field(text, position)
+        return Literal(text[position:], datatype=URIRef(datatype) if datatype else None, lang=language or None)
+    if text[0] == "B":
+        return BNode(text[1:])
+    return URIRef(text[1:])
+
+
+def padding(size):
+    return -size % 8
+
+
+def build_snapshot(graph, path):
+    """
+    Write a graph and its indexes to a snapshot file.
+
+    The file holds a header, the sorted term table (offsets and encoded terms; a term's ID is
+    its position) and the SPO, POS and OSP indexes as columns of 4-byte term IDs, followed by
+    the namespace bindings. Integers are in the byte order of the building machine, so a
+    snapshot is meant for the host it was built on.
+
+    Args:
+        graph (rdflib.Graph): The (materialized) graph.
+        path (str): Path of the snapshot file; written atomically.
+    """
+
+    encoded_terms = sorted({encode_term(term) for triple in graph for term in triple})
+    term_ids = {encoded_term: term_id for term_id, encoded_term in enumerate(encoded_terms)}
+    encoded_triples = [tuple(term_ids[encode_term(term)] for term in triple) for triple in graph]
+
+    term_offsets = array("Q", [0])
+    for encoded_term in encoded_terms:
+        term_offsets.append(term_offsets[-1] + len(encoded_term))
+    term_data = b"".join(encoded_terms)
+
+    namespaces = json.dumps({prefix: str(namespace) for prefix, namespace in graph.namespaces()}).encode("utf-8")
+
+    #write to a temporary file first so concurrent opens never map a partial snapshot
+    temp_path = path + ".tmp{}".format(os.getpid())
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(encoded_terms), len(encoded_triples), len(namespaces)))
+        file.write(term_offsets.tobytes())
+        file.write(term_data + b"\x00" * padding(len(term_data)))
+
+        for order in INDEX_ORDERS.values():
+            encoded_triples.sort(key=lambda triple: tuple(triple[position] for position in order))
+            for position in order:
+                file.write(array("I", (triple[position] for triple in encoded_triples)).tobytes())
+
+        file.write(namespaces)
+
+    os.replace(temp_path, path)
+
+
+class SnapshotStore(CompactStore):
+    """
+    Read-only RDFLib store over a memory-mapped graph snapshot (see `build_snapshot`).
+
+    Opening a snapshot only maps the file: the index columns and the term table are read in
+    place, so startup costs a page-in of what is touched rather than parsing and indexing the
+    graph, and processes opening the same snapshot share its pages. Terms are decoded (and
+    looked up by binary search over the sorted term table) on first use and then cached.
+
+    Args:
+        path (str): Path of the snapshot file.
+    """
+
+    def __init__(self, path):
+
+        Store.__init__(self)
+
+        with open(path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.term_count, self.triple_count, namespaces_size = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a graph snapshot (or one of an older format; delete it to rebuild it).")
+
+        view = memoryview(self.mmap)
+        offset = HEADER.size
+
+        self.term_offsets = view[offset:offset + (self.term_count + 1) * 8].cast("Q")
+        offset += (self.term_count + 1) * 8
+        self.term_data_offset = offset
+        offset += self.term_offsets[self.term_count] + padding(self.term_offsets[self.term_count])
+
+        self.indexes = {}
+        for index_name in INDEX_ORDERS:
+            columns = []
+            for _ in range(3):
+                columns.append(view[offset:offset + self.triple_count * 4].cast("I"))
+                offset += self.triple_count * 4
+            self.indexes[index_name] = tuple(columns)
+
+        namespaces = json.loads(bytes(view[offset:offset + namespaces_size]).decode("utf-8"))
+        self.namespace_bindings = {prefix: URIRef(namespace) for prefix, namespace in namespaces.items()}
+
+        self.decoded_terms = {} #term ID -> term, for the terms used so far
+        self.looked_up_ids = {} #term -> term ID, for the terms looked up so far
+
+
+    def get_encoded_term(self, term_id):
+
+        start = self.term_data_offset + self.term_offsets[term_id]
+        end = self.term_data_offset + self.term_offsets[term_id + 1]
+        return self.mmap[start:end]
+
+
+    def get_term(self, term_id):
+
+        term = self.decoded_terms.get(term_id)
+        if term is None:
+            term = self.decoded_terms[term_id] = decode_term(self.get_encoded_term(term_id))
+        return term
+
+
+    def get_term_id(self, term):
+
+        term_id = self.looked_up_ids.get(term)
+        if term_id is not None:
+            return term_id
+
+        encoded_term = encode_term(term)
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_encoded_term(middle) < encoded_term:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.term_count and self.get_encoded_term(low) == encoded_term:
+            self.looked_up_ids[term] = low
+            return low
+        return None
+
+
+def open_snapshot(path):
+    """
+    Open a graph snapshot.
+
+    Args:
+        path (str): Path of the snapshot file.
+
+    Returns:
+        rdflib.Graph: A read-only graph over the snapshot (layer an overlay over it to change it).
+    """
+
+    return Graph(store=SnapshotStore(path))
@@ -0,0 +1,182 @@
+import argparse
+import json
+import random
+from rdflib import Graph, Literal, Namespace
+from rdflib.namespace import RDF, OWL, XSD
+
+#local imports
+from ontology_utils import load_and_materialize_ontology, apply_changes
+from shacl_utils import InferredDataGraph, rdfs_closure
+from materializer import IncrementalMaterializer
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+
+def get_vocabulary(graph):
+    """
+    Collect the terms random deltas are drawn from.
+
+    Args:
+        graph (rdflib.Graph): The ontology graph.
+
+    Returns:
+        tuple: The individuals, the object and datatype properties, and the named classes,
+        each as a sorted list.
+    """
+
+    individuals = sorted(set(graph.subjects(RDF.type, OWL.NamedIndividual)))
+    properties = sorted(set(graph.subjects(RDF.type, OWL.ObjectProperty)) | set(graph.subjects(RDF.type, OWL.DatatypeProperty)))
+    classes = sorted(set(graph.subjects(RDF.type, OWL.Class)) - {OWL.Thing})
+    return individuals, properties, classes
+
+
+def random_changes(graph, vocabulary, rng):
+    """
+    Draw a random delta of instance triples: new property values and class memberships,
+    and removals of existing ones.
+
+    Args:
+        graph (rdflib.Graph): The current ontology graph.
+        vocabulary (tuple): Output of `get_vocabulary`.
+        rng (random.Random): The random number generator.
+
+    Returns:
+        list: (action, triple) pairs.
+    """
+
+    individuals, properties, classes = vocabulary
+    values = individuals + [Literal(True, datatype=XSD.boolean), Literal(False, datatype=XSD.boolean)]
+    changes = []
+
+    for _ in range(rng.randint(1, 4)):
+        if rng.random() < 0.5:
+            if rng.random() < 0.2:
+                changes.append(("add", (rng.choice(individuals), RDF.type, rng.choice(classes))))
+            else:
+                changes.append(("add", (rng.choice(individuals), rng.choice(properties), rng.choice(values))))
+        else:
+            predicate = rng.choice(properties + [RDF.type])
+            existing = sorted(triple for triple in graph.triples((None, predicate, None)) if triple[0] in individuals)
+            if existing:
+                changes.append(("remove", rng.choice(existing)))
+
+    return changes
+
+
+def check_inferred_data_graph(ontology_path, deltas, seed):
+    """
+    Check the incrementally maintained RDFS closure against a fresh closure after random deltas.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        deltas (int): Number of random deltas.
+        seed (int): Seed of the random deltas.
+
+    Returns:
+        dict: Number of deltas checked and, for those after which the closures differ, the
+        delta and the number of differing triples.
+    """
+
+    graph = load_and_materialize_ontology(ontology_path, reasoner="none")
+    inferred_graph = InferredDataGraph(graph)
+    vocabulary = get_vocabulary(graph)
+    rng = random.Random(seed)
+    mismatches = []
+
+    for index in range(deltas):
+        changes = random_changes(graph, vocabulary, rng)
+        inferred_graph.record(apply_changes(graph, changes))
+        inferred_graph.update(graph)
+
+        difference = set(rdfs_closure(graph)) ^ set(inferred_graph.graph)
+        if difference:
+            mismatches.append({"delta": index, "changes": describe_changes(changes), "differing_triples": len(difference)})
+
+    return {"deltas": deltas, "mismatches": mismatches}
+
+
+def check_materializer(ontology_path, deltas, seed):
+    """
+    Check the incrementally maintained materialization against materializing from scratch
+    after random deltas, some of which assert triples that were inferred.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        deltas (int): Number of random deltas.
+        seed (int): Seed of the random deltas.
+
+    Returns:
+        dict: Number of deltas checked and, for those after which the graphs or the inferred
+        triples differ, the delta and the number of differing triples.
+    """
+
+    graph = load_and_materialize_ontology(ontology_path, reasoner="none")
+    materializer = IncrementalMaterializer(graph)
+    asserted = set(graph) - materializer.inferred
+    vocabulary = get_vocabulary(graph)
+    rng = random.Random(seed)
+    mismatches = []
+
+    for index in range(deltas):
+        changes = random_changes(graph, vocabulary, rng)
+        if rng.random() < 0.3:
+            changes.append(("add", rng.choice(sorted(materializer.inferred))))
+
+        materializer.promote(changes)
+        materializer.update(apply_changes(graph, changes))
+        for action, triple in changes:
+            if action == "add":
+                asserted.add(triple)
+            else:
+                asserted.discard(triple)
+
+        expected = Graph()
+        for triple in asserted:
+            expected.add(triple)
+        IncrementalMaterializer(expected)
+
+        difference = (set(expected) ^ set(graph)) | (set(materializer.inferred) ^ (set(graph) - asserted))
+        if difference:
+            mismatches.append({"delta": index, "changes": describe_changes(changes), "differing_triples": len(difference)})
+
+    return {"deltas": deltas, "mismatches": mismatches}
+
+
+def check_asserted_inferred_triple(ontology_path):
+    """
+    Check that a triple asserted after it was inferred survives the removal of its premise.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+
+    Returns:
+        bool: True if the asserted triple is still in the graph.
+    """
+
+    graph = load_and_materialize_ontology(ontology_path, reasoner="none")
+    materializer = IncrementalMaterializer(graph)
+    premise = (OR.Step_A1_1, OR.toolUsed, OR.Scalpel)
+    inverse = (OR.Scalpel, OR.toolUsedInStep, OR.Step_A1_1) #inferred from the premise, then asserted
+
+    for changes in ([("add", premise)], [("add", inverse)], [("remove", premise)]):
+        materializer.promote(changes)
+        materializer.update(apply_changes(graph, changes))
+
+    return inverse in graph and inverse not in materializer.inferred
+
+
+def describe_changes(changes):
+    return [action + " " + " ".join(term.n3() for term in triple) for action, triple in changes]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check incrementally maintained inferences against recomputing them.")
+    parser.add_argument("ontology", nargs="?", default="or_ontology.owl", help="ontology file")
+    parser.add_argument("--deltas", type=int, default=100, help="random deltas per check")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random deltas")
+    arguments = parser.parse_args()
+
+    results = {"rdfs_closure": check_inferred_data_graph(arguments.ontology, arguments.deltas, arguments.seed),
+               "materializer": check_materializer(arguments.ontology, arguments.deltas, arguments.seed),
+               "asserted_inferred_triple_kept": check_asserted_inferred_triple(arguments.ontology)}
+    print(json.dumps(results, indent=4))
@@ -0,0 +1,124 @@
+import bisect
+import cProfile
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+#Upper bounds (in seconds) of the latency histogram buckets; the last bucket is unbounded
+BUCKET_BOUNDS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class LatencyRecorder:
+    """
+    Per-stage latency histograms and counters.
+
+    Recording a span costs two `perf_counter` calls, a bisect over the bucket bounds and a
+    few increments under a lock, so recording can be left on in production. Stages are
+    named freely, e.g. "validate" or "query.next_steps".
+    """
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.stages = {} #stage name -> {"count", "total", "max", "buckets"}
+
+
+    def record(self, stage, seconds):
+        """
+        Record the latency of one run of a stage.
+
+        Args:
+            stage (str): Name of the stage.
+            seconds (float): Duration of the run.
+        """
+
+        bucket = bisect.bisect_left(BUCKET_BOUNDS, seconds)
+
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = {"count": 0, "total": 0.0, "max": 0.0, "buckets": [0] * (len(BUCKET_BOUNDS) + 1)}
+            stats["count"] += 1
+            stats["total"] += seconds
+            if seconds > stats["max"]:
+                stats["max"] = seconds
+            stats["buckets"][bucket] += 1
+
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Time the enclosed block as one run of a stage.
+
+        Args:
+            stage (str): Name of the stage.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+
+    def snapshot(self):
+        """
+        Get the recorded statistics.
+
+        Returns:
+            dict: Stage name -> count, total, mean and max seconds, and the histogram as a
+            list of (bucket upper bound in seconds or None for unbounded, count) pairs.
+        """
+
+        with self.lock:
+            stages = {stage: dict(stats, buckets=list(stats["buckets"])) for stage, stats in self.stages.items()}
+
+        for stats in stages.values():
+            stats["mean"] = stats["total"] / stats["count"]
+            stats["buckets"] = [(bound, count) for bound, count in zip(BUCKET_BOUNDS + [None], stats["buckets"])]
+
+        return stages
+
+
+    def dump(self, path):
+        """
+        Write the recorded statistics to a JSON file.
+
+        Args:
+            path (str): Path of the file.
+        """
+
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=4)
+
+
+    def reset(self):
+        """
+        Forget all recorded statistics.
+        """
+
+        with self.lock:
+            self.stages = {}
+
+
+@contextmanager
+def profile(output_path):
+    """
+    Capture a cProfile profile of the enclosed block.
+
+    Args:
+        output_path (str): Path of the file to save the profile statistics to (readable with `pstats`).
+    """
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_path)
+
+
+#Process-wide recorder, used by default by the simulators and the query functions
+metrics = LatencyRecorder()
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+#local imports
+from ontology_utils import apply_changes, get_label_from_uri
+from overlay_store import overlay_graph
+from shacl_utils import get_scoped_shapes_graph
+
+#Speculative results for the advance from a position of the procedure, computed on the graph
+#at `graph_version`. `validation_version` and `validation_delta` are the graph version and
+#graph delta the next validation sees if the next steps' sensor update is the only change
+#in between; `scoped_shapes_graph` is then its shapes graph (None if the delta cannot be scoped).
+Lookahead = namedtuple("Lookahead", ["graph_version", "current_steps", "current_phase", "next_steps", "is_final_phase",
+                                     "next_phase_rows", "validation_version", "validation_delta", "scoped_shapes_graph"])
+
+
+def compute_lookahead(simulator):
+    """
+    Speculatively compute what the next advance of a simulator needs.
+
+    Determines the next steps (or, at the end of a phase, the next phase and its first steps), warms the step action table and
+    the step resource profiles for them, and, in incremental validation mode, scopes the
+    shapes to the delta of the next steps' sensor update by applying it to a throwaway
+    overlay of the graph. The simulator's graph is only read.
+
+    Args:
+        simulator (ORSimulator): The simulator, idle between two advances.
+
+    Returns:
+        Lookahead: The speculative results.
+    """
+
+    graph_version = simulator.graph_version
+    current_steps = list(simulator.current_steps)
+    current_phase = simulator.current_phase
+    procedure_index = simulator.get_procedure_index()
+
+    next_steps = simulator.get_next_steps(current_steps)
+    is_final_phase = None
+    next_phase_rows = None
+    candidate_steps = list(next_steps) #the steps the next advance moves to
+
+    if len(next_steps) == 0:
+        is_final_phase = procedure_index.is_final_phase(current_phase)
+        if not is_final_phase:
+            next_phase_rows = procedure_index.get_next_phase_and_phase_order_no(current_phase, simulator.current_plan)
+            for row in next_phase_rows:
+                simulator.get_phase_task(get_label_from_uri(row.next_phase))
+                candidate_steps.append(get_label_from_uri(row.first_step))
+                if row.co_occurring_step is not None:
+                    candidate_steps.append(get_label_from_uri(row.co_occurring_step))
+
+    simulator.get_step_actions(candidate_steps)
+    step_profiles = simulator.get_step_profiles()
+    for step in candidate_steps:
+        step_profiles.get_step_profile(step)
+
+    validation_version = None
+    validation_delta = None
+    scoped_shapes_graph = None
+
+    if simulator.incremental_validation and candidate_steps:
+        changes = []
+        for step_ID in candidate_steps:
+            changes.extend(simulator.sensor_changes.get(step_ID, []))
+
+        speculative_graph = overlay_graph(simulator.or_graph)
+        effective_changes = apply_changes(speculative_graph, changes)
+
+        validation_version = graph_version + 1 if effective_changes else graph_version
+        validation_delta = list(simulator.graph_delta) + effective_changes
+        scoped_shapes_graph = get_scoped_shapes_graph(simulator.shacl_shapes_graph, speculative_graph,
+                                                      validation_delta, simulator.shape_predicates)
+
+    return Lookahead(graph_version, current_steps, current_phase, next_steps, is_final_phase,
+                     next_phase_rows, validation_version, validation_delta, scoped_shapes_graph)
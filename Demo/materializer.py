@@ -0,0 +1,332 @@
+from itertools import chain
+from rdflib import Literal, URIRef
+from rdflib.namespace import RDF, RDFS, OWL
+
+#Predicates of the schema axioms the rules are compiled from; a change of one of them recompiles the rules
+SCHEMA_AXIOM_PREDICATES = {RDFS.subClassOf, RDFS.subPropertyOf, RDFS.domain, RDFS.range, OWL.inverseOf,
+                           OWL.equivalentClass, OWL.equivalentProperty, OWL.propertyChainAxiom}
+
+#Property characteristics the rules are compiled from (declared with rdf:type)
+PROPERTY_CHARACTERISTICS = {OWL.SymmetricProperty, OWL.TransitiveProperty}
+
+#Classes and properties everything belongs to; their memberships are not materialized
+TOP_TERMS = {OWL.Thing, RDFS.Resource, OWL.topObjectProperty, OWL.topDataProperty}
+
+
+def get_strict_closure(relation, term):
+    """
+    Get the terms reachable from a term through a relation, excluding the term itself.
+
+    Args:
+        relation (dict): Term -> set of directly related terms.
+        term: The start term.
+
+    Returns:
+        set: The reachable terms.
+    """
+
+    reached = set()
+    pending = [term]
+
+    while pending:
+        for related in relation.get(pending.pop(), ()):
+            if related not in reached:
+                reached.add(related)
+                pending.append(related)
+
+    reached.discard(term)
+    return reached
+
+
+def triple_matches(pattern, triple):
+    return all(term is None or term == value for term, value in zip(pattern, triple))
+
+
+class IncrementalMaterializer:
+    """
+    Forward-chaining materializer for an OWL RL subset, maintained incrementally.
+
+    The rules are compiled from the schema of the graph: inverse, symmetric and transitive
+    properties (prp-inv, prp-symp, prp-trp), subproperties and property chains (prp-spo1/2),
+    domains and ranges (prp-dom, prp-rng), and subclasses (cax-sco), with equivalent classes
+    and properties as mutual subclasses and subproperties. On creation, the missing
+    consequences of the graph are added to it; afterwards `update` adds and retracts only
+    the consequences of each delta, with delete/rederive for removals.
+
+    Triples the materializer added are tracked as inferred; all other triples of the graph
+    (including those of an earlier reasoner run) count as asserted and are never retracted
+    by it. A change of the schema recompiles the rules and rematerializes the whole graph.
+
+    Args:
+        graph (rdflib.Graph): The ontology graph, updated in place.
+        inferred (set, optional): If given, the graph is already materialized and these are
+            its inferred triples (as tracked by an earlier materializer); the set is updated
+            in place. Defaults to None.
+    """
+
+    def __init__(self, graph, inferred=None):
+
+        self.graph = graph
+        self.compile_rules()
+
+        if inferred is None:
+            self.inferred = set() #triples added by the materializer
+            self.insert(list(self.graph))
+        else:
+            self.inferred = inferred
+
+
+    def compile_rules(self):
+        """
+        Compile the rule tables from the schema axioms of the graph.
+        """
+
+        graph = self.graph
+
+        direct_super_properties = {}
+        for p, _, q in graph.triples((None, RDFS.subPropertyOf, None)):
+            direct_super_properties.setdefault(p, set()).add(q)
+        for p, _, q in graph.triples((None, OWL.equivalentProperty, None)):
+            direct_super_properties.setdefault(p, set()).add(q)
+            direct_super_properties.setdefault(q, set()).add(p)
+
+        direct_super_classes = {}
+        for c, _, d in graph.triples((None, RDFS.subClassOf, None)):
+            direct_super_classes.setdefault(c, set()).add(d)
+        for c, _, d in graph.triples((None, OWL.equivalentClass, None)):
+            direct_super_classes.setdefault(c, set()).add(d)
+            direct_super_classes.setdefault(d, set()).add(c)
+
+        #only named classes and properties; class expressions (blank nodes) are outside the subset
+        self.super_properties = {p: {q for q in get_strict_closure(direct_super_properties, p) if isinstance(q, URIRef)} - TOP_TERMS
+                                 for p in direct_super_properties}
+        self.super_classes = {c: {d for d in get_strict_closure(direct_super_classes, c) if isinstance(d, URIRef)} - TOP_TERMS
+                              for c in direct_super_classes}
+
+        self.inverse_properties = {}
+        for p, _, q in graph.triples((None, OWL.inverseOf, None)):
+            self.inverse_properties.setdefault(p, set()).add(q)
+            self.inverse_properties.setdefault(q, set()).add(p)
+
+        self.symmetric_properties = set(graph.subjects(RDF.type, OWL.SymmetricProperty))
+        self.transitive_properties = set(graph.subjects(RDF.type, OWL.TransitiveProperty))
+
+        self.domains = {}
+        for p, _, c in graph.triples((None, RDFS.domain, None)):
+            if isinstance(c, URIRef) and c not in TOP_TERMS:
+                self.domains.setdefault(p, set()).add(c)
+
+        self.ranges = {}
+        for p, _, c in graph.triples((None, RDFS.range, None)):
+            if isinstance(c, URIRef) and c not in TOP_TERMS:
+                self.ranges.setdefault(p, set()).add(c)
+
+        self.chains = {} #property -> (position, chain, super property) for every chain it occurs in
+        for super_property, _, chain_list in graph.triples((None, OWL.propertyChainAxiom, None)):
+            property_chain = list(graph.items(chain_list))
+            for position, p in enumerate(property_chain):
+                self.chains.setdefault(p, []).append((position, property_chain, super_property))
+
+
+    def consequences(self, triple, match):
+        """
+        Get the direct consequences of a triple under the rules.
+
+        Args:
+            triple (tuple): The premise.
+            match (callable): Returns the triples matching a pattern; used for the rules
+                joining the premise with other triples (transitivity and property chains).
+
+        Yields:
+            tuple: The conclusions (possibly already present).
+        """
+
+        s, p, o = triple
+
+        if p == RDF.type:
+            for c in self.super_classes.get(o, ()):
+                yield (s, RDF.type, c)
+            return
+
+        for q in self.super_properties.get(p, ()):
+            yield (s, q, o)
+        for c in self.domains.get(p, ()):
+            yield (s, RDF.type, c)
+
+        if isinstance(o, Literal):
+            return
+
+        for c in self.ranges.get(p, ()):
+            yield (o, RDF.type, c)
+        for q in self.inverse_properties.get(p, ()):
+            yield (o, q, s)
+        if p in self.symmetric_properties:
+            yield (o, p, s)
+
+        if p in self.transitive_properties:
+            for _, _, following in match((o, p, None)):
+                yield (s, p, following)
+            for preceding, _, _ in match((None, p, s)):
+                yield (preceding, p, o)
+
+        for position, property_chain, super_property in self.chains.get(p, ()):
+            starts = {s}
+            for q in reversed(property_chain[:position]):
+                starts = {start for node in starts for start, _, _ in match((None, q, node))}
+            ends = {o}
+            for q in property_chain[position + 1:]:
+                ends = {end for node in ends for _, _, end in match((node, q, None))}
+            for start in starts:
+                for end in ends:
+                    yield (start, super_property, end)
+
+
+    def insert(self, triples):
+        """
+        Add the consequences of triples present in the graph (semi-naive forward chaining).
+
+        Args:
+            triples (list): The new premises.
+
+        Returns:
+            list: The inferred triples added to the graph.
+        """
+
+        added = []
+        pending = list(triples)
+
+        while pending:
+            for conclusion in self.consequences(pending.pop(), self.graph.triples):
+                if conclusion not in self.graph:
+                    self.graph.add(conclusion)
+                    self.inferred.add(conclusion)
+                    added.append(conclusion)
+                    pending.append(conclusion)
+
+        return added
+
+
+    def delete(self, triples):
+        """
+        Retract the consequences of triples removed from the graph (delete/rederive).
+
+        All inferred triples the removed ones entailed, directly or not, are removed
+        (overdeletion); those, and the removed triples themselves, that the remaining triples
+        of their subjects still entail are then rederived.
+
+        Args:
+            triples (list): The removed premises.
+
+        Returns:
+            tuple: The overdeleted triples and the triples rederived into the graph.
+        """
+
+        deleted = set(triples)
+
+        def match(pattern): #the graph before the deletion
+            yield from self.graph.triples(pattern)
+            yield from (triple for triple in deleted if triple_matches(pattern, triple) and triple not in self.graph)
+
+        overdeleted = set()
+        pending = list(triples)
+
+        while pending:
+            for conclusion in self.consequences(pending.pop(), match):
+                if conclusion in self.inferred and conclusion not in overdeleted:
+                    overdeleted.add(conclusion)
+                    deleted.add(conclusion)
+                    pending.append(conclusion)
+
+        for triple in overdeleted:
+            self.graph.remove(triple)
+            self.inferred.discard(triple)
+
+        #every rule has a premise with the conclusion's subject as its subject or object
+        rederived = set()
+        for node in {s for s, _, _ in deleted}:
+            for premise in chain(self.graph.triples((node, None, None)), self.graph.triples((None, None, node))):
+                for conclusion in self.consequences(premise, self.graph.triples):
+                    if conclusion in deleted and conclusion not in self.graph:
+                        rederived.add(conclusion)
+
+        for triple in rederived:
+            self.graph.add(triple)
+            self.inferred.add(triple)
+
+        return overdeleted, rederived
+
+
+    def promote(self, changes):
+        """
+        Prepare the graph for changes asserting triples the materializer inferred.
+
+        Adding a triple that is already inferred would not change the graph, so it would stay
+        inferred and be retracted with its premises later. Such triples are taken out of the
+        graph and the inferred triples instead: applying the changes adds them back as
+        asserted, so they are recorded (e.g. by a graph journal) like any other addition.
+
+        Args:
+            changes (list): The (action, triple) pairs about to be applied to the graph.
+
+        Returns:
+            list: The promoted triples.
+        """
+
+        promoted = [triple for action, triple in changes if action == "add" and triple in self.inferred]
+
+        for triple in promoted:
+            self.graph.remove(triple)
+            self.inferred.discard(triple)
+
+        return promoted
+
+
+    def update(self, changes):
+        """
+        Bring the inferred triples up to date with changes applied to the graph.
+
+        Args:
+            changes (list): The (action, triple) pairs that were applied to the graph.
+
+        Returns:
+            list: The (action, triple) pairs the materializer applied to the graph in turn.
+        """
+
+        if any(p in SCHEMA_AXIOM_PREDICATES or (p == RDF.type and o in PROPERTY_CHARACTERISTICS) for _, (_, p, o) in changes):
+            return self.rematerialize()
+
+        last_actions = {}
+        for action, triple in changes:
+            last_actions[triple] = action
+
+        removed = [triple for triple, action in last_actions.items() if action == "remove" and triple not in self.graph]
+        added = [triple for triple, action in last_actions.items() if action == "add" and triple in self.graph]
+
+        for triple in removed + added: #asserted from now on, or gone
+            self.inferred.discard(triple)
+
+        overdeleted, rederived = self.delete(removed) if removed else (set(), set())
+        inserted = self.insert(added + list(rederived))
+
+        return ([("remove", triple) for triple in overdeleted if triple not in self.graph]
+                + [("add", triple) for triple in chain(rederived, inserted) if triple not in overdeleted])
+
+
+    def rematerialize(self):
+        """
+        Recompile the rules and recompute all inferred triples.
+
+        Returns:
+            list: The (action, triple) pairs the materializer applied to the graph.
+        """
+
+        previously_inferred = self.inferred
+        for triple in previously_inferred:
+            self.graph.remove(triple)
+
+        self.inferred = set()
+        self.compile_rules()
+        inserted = set(self.insert(list(self.graph)))
+
+        return ([("remove", triple) for triple in previously_inferred - inserted]
+                + [("add", triple) for triple in inserted - previously_inferred])
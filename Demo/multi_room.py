@@ -0,0 +1,271 @@
+import contextlib
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from rdflib import Graph, Namespace
+
+#local imports
+from ontology_utils import load_and_materialize_ontology
+from compact_store import CompactStore
+from procedure_index import ProcedureIndex
+from OR_simulator import ORSimulator, prepare_base_graph
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+
+class RoomOutput(io.TextIOBase):
+    """
+    Replacement of sys.stdout sending what a thread prints to the buffer it is bound to.
+
+    Rooms are advanced in several threads at once and their simulators print to sys.stdout;
+    while a thread works for a room, it is bound to that room's buffer, so the output of
+    different rooms never interleaves. Threads that are not bound print to the original
+    stdout.
+
+    Args:
+        stdout (io.TextIOBase): The stream unbound threads print to.
+    """
+
+    def __init__(self, stdout):
+
+        super().__init__()
+        self.stdout = stdout
+        self.local = threading.local() #buffer of the current thread, if bound
+
+
+    def target(self):
+        return getattr(self.local, "buffer", None) or self.stdout
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+
+    @contextlib.contextmanager
+    def bind(self, buffer):
+        """
+        Send what the current thread prints to a buffer, within the context.
+
+        Args:
+            buffer (io.StringIO): The buffer.
+        """
+
+        previous_buffer = getattr(self.local, "buffer", None)
+        self.local.buffer = buffer
+        try:
+            yield
+        finally:
+            self.local.buffer = previous_buffer
+
+
+#guards replacing sys.stdout with a RoomOutput
+room_output_lock = threading.Lock()
+
+
+def get_room_output():
+    """
+    Get the RoomOutput of sys.stdout, installing it over the current stdout if needed.
+
+    Returns:
+        RoomOutput: The installed RoomOutput.
+    """
+
+    with room_output_lock:
+        if not isinstance(sys.stdout, RoomOutput):
+            sys.stdout = RoomOutput(sys.stdout)
+        return sys.stdout
+
+
+def empty_answer(room_id, message):
+    return ""
+
+
+class MultiRoomEngine:
+    """
+    Run the procedures of many operating rooms concurrently in one process.
+
+    The ontology is loaded and materialized once into a shared, read-only base graph. Each
+    room is an ORSimulator with its own procedure state whose graph is an overlay over the
+    base graph (see OverlayStore): it only stores that room's sensor deltas, so every extra
+    room costs memory proportional to its changes rather than to the ontology. The procedure
+    index of the base graph is shared as well, until a room changes the procedure structure,
+    and so are the inferences of the base graph the room options need: its materialization
+    (incremental reasoning) and its RDFS closure (separate schema, native or incremental
+    validation), which the rooms layer their changes over (see `prepare_base_graph`).
+
+    Rooms run without a console, like replays: their prompts (e.g. on a violation) are
+    answered by `answer`, pauses are skipped, and what a room prints goes to its own buffer
+    (see `take_output`), together with its prompts and their answers.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        cache_dir (str, optional): Directory of the materialization cache. Defaults to None.
+        max_workers (int, optional): Number of threads advancing rooms. Defaults to None
+            (the ThreadPoolExecutor default).
+        compact_store (bool, optional): Whether to keep the base graph (and its RDFS closure, if
+            the options need it) dictionary-encoded in a CompactStore, which takes several times
+            less memory. Defaults to False.
+        reasoner (str, optional): Reasoner the ontology is materialized with. Defaults to "none",
+            as for ORSimulator.
+        answer (callable, optional): Called with the room ID and the prompt, returns the reply
+            to a room's prompt. Defaults to an empty reply.
+        **simulator_options: Further ORSimulator options applied to every room.
+    """
+
+    def __init__(self, ontology_path, shacl_shape_path, cache_dir=None, max_workers=None, compact_store=False, reasoner="none", answer=empty_answer, **simulator_options):
+
+        self.ontology_path = ontology_path
+        self.shacl_shape_path = shacl_shape_path
+        self.simulator_options = simulator_options
+        self.base_graph = load_and_materialize_ontology(ontology_path, reasoner=reasoner, cache_dir=cache_dir)
+        if compact_store:
+            self.base_graph = Graph(store=CompactStore(self.base_graph))
+        #ORSimulator arguments of every room; with compact_store, the shared closure is compacted too
+        self.shared_base = prepare_base_graph(self.base_graph, dict(simulator_options, compact_store=compact_store))
+        self.procedure_index = ProcedureIndex(self.shared_base["base_graph"])
+        self.rooms = {} #room ID -> ORSimulator
+        self.outputs = {} #room ID -> buffer of what the room printed
+        self.answer = answer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+
+    def open_room(self, room_id, start=True):
+        """
+        Open a room running the procedure from its first step(s).
+
+        Args:
+            room_id (str): Identifier of the room.
+            start (bool, optional): Whether to execute the first step(s) right away. Defaults to True.
+
+        Returns:
+            ORSimulator: The room's simulator.
+        """
+
+        if room_id in self.rooms:
+            raise ValueError(f"Room {room_id} is already open.")
+
+        room = ORSimulator(self.ontology_path, self.shacl_shape_path, **self.shared_base, **self.simulator_options)
+        room.procedure_index = self.procedure_index
+        room.pause = lambda seconds: None
+
+        def prompt(message=""):
+            answer = self.answer(room_id, message)
+            print(message + answer) #as a console shows it
+            return answer
+
+        room.prompt = prompt
+        self.rooms[room_id] = room
+        self.outputs[room_id] = io.StringIO()
+
+        if start:
+            self.run_in_room(room_id, room.start_procedure)
+
+        return room
+
+
+    def run_in_room(self, room_id, function, *args):
+        """
+        Call a function for a room, with what it prints going to the room's buffer.
+
+        Args:
+            room_id (str): Identifier of the room.
+            function (callable): The function, e.g. a method of the room's simulator.
+            *args: Its arguments.
+
+        Returns:
+            The function's result.
+        """
+
+        with get_room_output().bind(self.outputs[room_id]):
+            return function(*args)
+
+
+    def take_output(self, room_id):
+        """
+        Get what a room printed since the last call, and clear it.
+
+        Args:
+            room_id (str): Identifier of the room.
+
+        Returns:
+            str: The room's output.
+        """
+
+        buffer = self.outputs[room_id]
+        output = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return output
+
+
+    def close_room(self, room_id):
+        """
+        Close a room, discarding its overlay.
+
+        Args:
+            room_id (str): Identifier of the room.
+        """
+
+        room = self.rooms.pop(room_id)
+        room.ongoing_procedure = False
+        del self.outputs[room_id]
+
+
+    def advance_rooms(self, room_ids=None):
+        """
+        Advance rooms to their next step or phase concurrently.
+
+        Rooms whose procedure has finished, or that are handling a violation, are skipped.
+
+        Args:
+            room_ids (list, optional): The rooms to advance. Defaults to all open rooms.
+
+        Returns:
+            dict: Room ID -> whether the room's procedure is still ongoing.
+        """
+
+        if room_ids is None:
+            room_ids = list(self.rooms)
+
+        futures = {}
+        for room_id in room_ids:
+            room = self.rooms[room_id]
+            if room.ongoing_procedure and not room.violation_occurred:
+                futures[room_id] = self.executor.submit(self.run_in_room, room_id, room.advance_simulation)
+
+        for future in futures.values():
+            future.result()
+
+        return {room_id: self.rooms[room_id].ongoing_procedure for room_id in room_ids}
+
+
+    def validate_rooms(self, validation_service, room_ids=None):
+        """
+        Validate rooms in parallel in the worker processes of a validation service.
+
+        Args:
+            validation_service (ValidationService): A service loaded with the same ontology and shapes.
+            room_ids (list, optional): The rooms to validate. Defaults to all open rooms.
+
+        Returns:
+            dict: Room ID -> future resolving to (conforms, validation report).
+        """
+
+        if room_ids is None:
+            room_ids = list(self.rooms)
+
+        return {room_id: validation_service.submit_simulator(self.rooms[room_id]) for room_id in room_ids}
+
+
+    def shutdown(self):
+        """
+        Close all rooms and stop the worker threads.
+        """
+
+        for room_id in list(self.rooms):
+            self.close_room(room_id)
+        self.executor.shutdown()
@@ -1,67 +1,285 @@
+import hashlib
+import io
+import json
+import os
+import sys
 from rdflib import Graph, Literal
 from owlready2 import get_ontology, sync_reasoner, sync_reasoner_pellet
 from rdflib.namespace import XSD
 
-def load_and_materialize_ontology(file_path, format="xml", reasoner = "hermit"):
+#local imports
+from materializer import IncrementalMaterializer
+from graph_snapshot import build_snapshot, open_snapshot
+
+#Length from which a delta awaiting validation is coalesced to one change per triple (see coalesce_changes)
+COALESCE_SIZE = 10000
+
+#Flags passed to the owlready2 reasoner calls; part of the materialization cache key
+REASONER_FLAGS = {
+    "hermit": {"infer_property_values": True},
+    "pellet": {"infer_property_values": True, "infer_data_property_values": True},
+}
+
+def load_and_materialize_ontology(file_path, format="xml", reasoner = "hermit", cache_dir = None, snapshot_dir = None):
     """
-    Load the ontology, perform reasoning on it, save it to a working ontology file and return
-    a materialized RDFLib graph.
+    Load the ontology, perform reasoning on it and return a materialized RDFLib graph.
+
+    The reasoned ontology is handed from owlready2 to RDFLib through an in-memory N-Triples
+    buffer, so no working ontology file is written and several simulators can run from the
+    same directory.
+
+    If a cache directory is given, the materialized graph is stored there as N-Triples under a
+    key derived from the input ontology contents, the reasoner and its flags. Later loads with
+    the same key read the cached graph directly and skip the reasoner (and the JVM) entirely.
+
+    If a snapshot directory is given, the materialized graph is opened from a memory-mapped
+    snapshot under the same key instead (see `graph_snapshot.py`), which is built first if it 
+    does not exist yet. The snapshot graph is read-only.
 
     Args:
         file_path (str): Path to the ontology file.
-        namespace (Namespace): RDFLib Namespace object for the ontology (e.g., OR).
-        prefix (str): Prefix for the namespace.
-        format (str, optional): Format of the ontology file. Defaults to "xml".
+        format (str, optional): Format of the ontology file. Defaults to "xml". Unused since the
+            hand-off to RDFLib is in memory; kept for backwards compatibility.
+        reasoner (str, optional): Reasoner to apply, "hermit", "pellet" (both run in a JVM) or
+            "python" (the OWL RL subset of `materializer.py`, in process); any other value (e.g.
+            "none") loads the ontology as asserted. Defaults to "hermit".
+        cache_dir (str, optional): Directory of the materialization cache. Defaults to None (no caching).
+        snapshot_dir (str, optional): Directory of the graph snapshots. Defaults to None (no snapshot).
 
     Returns:
         rdflib.Graph: A materialized ontology graph with inferred triples.
     """
 
+    if snapshot_dir is not None:
+        snapshot_path = os.path.join(snapshot_dir, get_materialization_key(file_path, reasoner) + ".snapshot")
+
+        if not os.path.exists(snapshot_path):
+            graph_or = load_and_materialize_ontology(file_path, reasoner=reasoner, cache_dir=cache_dir)
+            os.makedirs(snapshot_dir, exist_ok=True)
+            build_snapshot(graph_or, snapshot_path)
+
+        return open_snapshot(snapshot_path)
+
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, get_materialization_key(file_path, reasoner) + ".nt")
+
+        if os.path.exists(cache_path):
+            graph_or = Graph()
+            graph_or.parse(cache_path, format="nt")
+            return graph_or
+
     ontology = get_ontology(file_path).load()
 
         #Apply reasoner and save the ontology with inferences
     with ontology:
         if reasoner == "hermit":
-            sync_reasoner(infer_property_values = True)
+            sync_reasoner(**REASONER_FLAGS[reasoner])
         elif reasoner == "pellet":
-            sync_reasoner_pellet(infer_property_values = True, infer_data_property_values = True)
-
-    materialized_ontology_path = "working_ontology.owl"
-    ontology.save(materialized_ontology_path, format="rdfxml")
+            sync_reasoner_pellet(**REASONER_FLAGS[reasoner])
 
-    #Load materialized (working) graph with RDFlib
+    #Hand the materialized graph over to RDFlib without touching the disk
+    buffer = io.BytesIO()
+    ontology.save(buffer, format="ntriples")
     graph_or = Graph()
-    graph_or.parse(materialized_ontology_path, format)
+    graph_or.parse(data=buffer.getvalue(), format="nt")
+
+    if reasoner == "python":
+        IncrementalMaterializer(graph_or)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        #write to a temporary file first so concurrent loads never read a partial snapshot
+        temp_cache_path = cache_path + ".tmp{}".format(os.getpid())
+        graph_or.serialize(temp_cache_path, format="nt", encoding="utf-8")
+        os.replace(temp_cache_path, cache_path)
 
     return graph_or
 
 
-def parse_json_to_rdflib(json_triple, namespace):
+def get_materialization_key(file_path, reasoner = "hermit"):
+    """
+    Compute the materialization cache key of an ontology.
+
+    The key is a hash of the ontology file contents, the reasoner and the reasoner flags,
+    so any change to one of them invalidates the cache.
+
+    Args:
+        file_path (str): Path to the ontology file.
+        reasoner (str, optional): Reasoner applied to the ontology. Defaults to "hermit".
+
+    Returns:
+        str: Hexadecimal SHA-256 digest identifying the materialized graph.
+    """
+
+    key = hashlib.sha256()
+
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            key.update(chunk)
+
+    settings = {"reasoner": str(reasoner), "flags": REASONER_FLAGS.get(reasoner, {})}
+    key.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+
+    return key.hexdigest()
+
+
+def parse_json_to_rdflib(json_triple, namespace, term_cache=None):
     """
     Convert a JSON triple data to an RDFLib triple.
 
     Args:
         json_triple (dict): A JSON representation of a triple.
         namespace (Namespace): RDFLib Namespace object for the ontology.
+        term_cache (dict, optional): Interned RDFLib terms, keyed by their JSON value. When
+            given, terms are constructed once and reused across calls. Defaults to None.
 
     Returns:
         tuple: An RDFLib triple (subject, predicate, object).
     """
 
-    s = namespace[json_triple.get("subject")]
-    p = namespace[json_triple.get("predicate")]
-    o = json_triple.get("object")
-
-    if isinstance(o, bool):
-        o = Literal(o, datatype=XSD.boolean)
-    else:
-        o = namespace[json_triple.get("object")]
+    if term_cache is None:
+        term_cache = {}
 
-    rdflib_triple = (s, p, o)
+    rdflib_triple = tuple(get_term(json_triple.get(key), namespace, term_cache) for key in ("subject", "predicate", "object"))
 
     return rdflib_triple
 
 
+def get_term(value, namespace, term_cache):
+    """
+    Get the (interned) RDFLib term of a JSON value: booleans become xsd:boolean literals,
+    everything else a URI in the namespace.
+
+    Args:
+        value (str or bool): The JSON value.
+        namespace (Namespace): RDFLib Namespace object for the ontology.
+        term_cache (dict): Interned RDFLib terms, keyed by (namespace, type, value).
+
+    Returns:
+        URIRef or Literal: The RDFLib term.
+    """
+
+    key = (namespace, type(value), value)
+    term = term_cache.get(key)
+
+    if term is None:
+        if isinstance(value, bool):
+            term = Literal(value, datatype=XSD.boolean)
+        else:
+            term = namespace[value]
+        term_cache[key] = term
+
+    return term
+
+
+def compile_sensor_data(sensor_data, namespace, term_cache=None):
+    """
+    Pre-compile sensor data entries into graph changes.
+
+    Args:
+        sensor_data (dict): Sensor data in the format of sensor_data.json, keyed by step ID.
+        namespace (Namespace): RDFLib Namespace object for the ontology.
+        term_cache (dict, optional): Interned RDFLib terms shared with other conversions. Defaults to None.
+
+    Returns:
+        dict: Step ID -> list of (action, triple) pairs, for entries with an "add" or "remove" action.
+    """
+
+    if term_cache is None:
+        term_cache = {}
+
+    sensor_changes = {}
+
+    for step_ID, step_data in sensor_data.items():
+        act = step_data.get("action")
+
+        if act in ("add", "remove"):
+            sensor_changes[step_ID] = [(act, parse_json_to_rdflib(triple, namespace, term_cache)) for triple in step_data.get("triples", [])]
+
+    return sensor_changes
+
+
+def invert_changes(changes):
+    """
+    Get the graph changes that undo the given changes.
+
+    Args:
+        changes (list): (action, triple) pairs.
+
+    Returns:
+        list: (action, triple) pairs with reversed actions, in reverse order.
+    """
+
+    return [("remove" if action == "add" else "add", triple) for action, triple in reversed(changes)]
+
+
+def coalesce_changes(changes):
+    """
+    Summarize graph changes as one change per triple, its last action.
+
+    Args:
+        changes (list): (action, triple) pairs.
+
+    Returns:
+        list: (action, triple) pairs, at most one per triple.
+    """
+
+    last_actions = {}
+    for action, triple in changes:
+        last_actions[triple] = action
+    return [(action, triple) for triple, action in last_actions.items()]
+
+
+def apply_changes(graph, changes):
+    """
+    Apply graph changes in bulk and report which of them actually changed the graph.
+
+    Adding a triple that is already present or removing one that is absent is a no-op and
+    is left out of the result. The effective changes are applied in runs of the same
+    action: additions through a single `addN` call, removals directly on the store, so the
+    order of additions and removals is preserved without paying per-triple overhead.
+
+    Args:
+        graph (rdflib.Graph): The graph to update.
+        changes (list): (action, triple) pairs.
+
+    Returns:
+        list: The effective (action, triple) pairs, in order.
+
+    Updates:
+        graph (rdflib.Graph): The changes are applied.
+    """
+
+    effective_changes = []
+    presence = {} #triple -> whether it is present after the changes seen so far
+
+    for action, triple in changes:
+        present = presence.get(triple)
+        if present is None:
+            present = triple in graph
+
+        if (action == "add") != present:
+            effective_changes.append((action, triple))
+            presence[triple] = action == "add"
+
+    start = 0
+    while start < len(effective_changes):
+        action = effective_changes[start][0]
+        end = start
+        while end < len(effective_changes) and effective_changes[end][0] == action:
+            end += 1
+
+        if action == "add":
+            graph.addN((s, p, o, graph) for _, (s, p, o) in effective_changes[start:end])
+        else:
+            for _, triple in effective_changes[start:end]:
+                graph.store.remove(triple, context=graph)
+
+        start = end
+
+    return effective_changes
+
+
 def query_result_to_list(query_result):
     """
     Convert a SPARQL query result to a list of (human readable) names (extracts 
@@ -95,4 +313,16 @@ def get_label_from_uri(uri):
     """
     
     uri_str = str(uri)
-    return uri_str.split('/')[-1]
\ No newline at end of file
+    return uri_str.split('/')[-1]
+
+
+if __name__ == "__main__":
+    #Usage: python ontology_utils.py build-snapshot ontology.owl snapshot_dir [reasoner] [cache_dir]
+    #(the reasoner defaults to ORSimulator's, so the simulator finds the snapshot)
+    if len(sys.argv) < 4 or sys.argv[1] != "build-snapshot":
+        sys.exit("Usage: python ontology_utils.py build-snapshot ontology.owl snapshot_dir [reasoner] [cache_dir]")
+
+    reasoner = sys.argv[4] if len(sys.argv) > 4 else "none"
+    cache_dir = sys.argv[5] if len(sys.argv) > 5 else None
+    snapshot = load_and_materialize_ontology(sys.argv[2], reasoner=reasoner, cache_dir=cache_dir, snapshot_dir=sys.argv[3])
+    print(f"Snapshot of {len(snapshot)} triples in {snapshot.store.mmap.size()} bytes")
@@ -0,0 +1,167 @@
+from collections.abc import MutableSet
+from rdflib import Graph
+from rdflib.store import Store
+from rdflib.plugins.stores.memory import Memory
+
+
+class OverlayStore(Store):
+    """
+    RDFLib store layering local changes over a shared, read-only base graph.
+
+    Added triples are kept in a small local store and removed base triples in a set, so
+    the memory used by an overlay is proportional to its changes, not to the base graph.
+    A `Graph(store=OverlayStore(base_graph))` can be queried, validated and updated like
+    any other graph; the base graph is never modified and may back many overlays at once.
+
+    Args:
+        base_graph (rdflib.Graph): The shared graph; it must not change while overlays use it.
+    """
+
+    #a single implicit graph; declared context and graph aware so pyshacl can wrap overlays in a Dataset
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = True
+
+    def __init__(self, base_graph):
+
+        super().__init__()
+        self.base_graph = base_graph
+        self.added = Memory() #triples added on top of the base graph
+        self.removed = set() #base graph triples hidden by the overlay
+
+        for prefix, namespace in base_graph.namespaces():
+            self.added.bind(prefix, namespace)
+
+
+    def add(self, triple, context=None, quoted=False):
+
+        if triple in self.removed:
+            self.removed.discard(triple)
+        elif triple not in self.base_graph:
+            self.added.add(triple, context=None, quoted=quoted)
+        super().add(triple, context, quoted)
+
+
+    def remove(self, triple_pattern, context=None):
+
+        for triple, _ in list(self.triples(triple_pattern)):
+            if triple in self.base_graph:
+                self.removed.add(triple)
+            else:
+                self.added.remove(triple)
+        super().remove(triple_pattern, context)
+
+
+    def triples(self, triple_pattern, context=None):
+
+        for triple in self.base_graph.triples(triple_pattern):
+            if triple not in self.removed:
+                yield triple, iter(())
+
+        for triple, _ in self.added.triples(triple_pattern):
+            yield triple, iter(())
+
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def add_graph(self, graph):
+        pass
+
+    def remove_graph(self, graph):
+        pass
+
+
+    def __len__(self, context=None):
+
+        return len(self.base_graph) - len(self.removed) + len(self.added)
+
+
+    def changes(self):
+        """
+        Get the overlay's changes relative to the base graph.
+
+        Returns:
+            list: (action, triple) pairs that turn the base graph into the overlay's graph.
+        """
+
+        return [("remove", triple) for triple in self.removed] + [("add", triple) for triple, _ in self.added.triples((None, None, None))]
+
+
+    def bind(self, prefix, namespace, override=True):
+        self.added.bind(prefix, namespace, override=override)
+
+    def namespace(self, prefix):
+        return self.added.namespace(prefix)
+
+    def prefix(self, namespace):
+        return self.added.prefix(namespace)
+
+    def namespaces(self):
+        return self.added.namespaces()
+
+
+class OverlaySet(MutableSet):
+    """
+    Set layering local changes over a shared, read-only base set (e.g. of inferred triples).
+
+    Like OverlayStore, it only stores the elements added to and removed from the base set.
+
+    Args:
+        base (set): The shared set; it must not change while overlays use it.
+    """
+
+    def __init__(self, base):
+
+        self.base = base
+        self.added = set() #elements added on top of the base set
+        self.removed = set() #base set elements hidden by the overlay
+
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+
+    def __contains__(self, element):
+        return element in self.added or (element in self.base and element not in self.removed)
+
+    def __iter__(self):
+
+        for element in self.base:
+            if element not in self.removed:
+                yield element
+        yield from self.added
+
+    def __len__(self):
+        return len(self.base) - len(self.removed) + len(self.added)
+
+
+    def add(self, element):
+
+        if element in self.base:
+            self.removed.discard(element)
+        else:
+            self.added.add(element)
+
+    def discard(self, element):
+
+        if element in self.base:
+            self.removed.add(element)
+        else:
+            self.added.discard(element)
+
+
+def overlay_graph(base_graph):
+    """
+    Create a writable graph over a shared, read-only base graph.
+
+    Args:
+        base_graph (rdflib.Graph): The shared graph.
+
+    Returns:
+        rdflib.Graph: A graph holding the base graph's triples, whose changes stay local.
+    """
+
+    return Graph(store=OverlayStore(base_graph))
@@ -0,0 +1,171 @@
+from collections import namedtuple
+from rdflib import Namespace, Literal
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+#Predicates the index is built from; changing any of them invalidates the index
+STRUCTURAL_PREDICATES = {OR.follows, OR.followedBy, OR["co-occur"], OR.phaseOrder, OR.hasPhase,
+                         OR.phaseStartStep, OR.isFinalPhase, OR.phaseTask}
+
+#Same fields as the rows of the get_next_phase_and_phase_order_no query
+NextPhaseRow = namedtuple("NextPhaseRow", ["next_phase", "current_phase_no", "next_phase_no", "first_step", "co_occurring_step"])
+
+
+def add_unique(index, key, value):
+    """
+    Append a value to the list stored under a key, unless it is already there.
+
+    Args:
+        index (dict): Mapping of keys to lists of values.
+        key: The key to append to.
+        value: The value to append.
+    """
+
+    values = index.setdefault(key, [])
+    if value not in values:
+        values.append(value)
+
+
+class ProcedureIndex:
+    """
+    Precompiled navigation structure of the procedure (steps, phases and plans).
+
+    Built once from the materialized graph, it answers the structural questions of the
+    navigation queries in `queries.py` (next steps, next phase, final phase, phase task)
+    with dictionary lookups instead of SPARQL. Results have the same rows as the queries.
+    The index must be rebuilt when a triple with one of the STRUCTURAL_PREDICATES changes.
+
+    Args:
+        graph (rdflib.Graph): The materialized ontology graph.
+    """
+
+    def __init__(self, graph):
+
+        self.next_steps = {} #step -> steps that follow it (follows/followedBy)
+        self.co_occurring_steps = {} #step -> steps it co-occurs with (step or:co-occur ?other)
+        self.reverse_co_occurring_steps = {} #step -> steps co-occurring with it (?other or:co-occur step)
+        self.phase_order = {} #phase -> phase order literals
+        self.plan_phases_by_order = {} #plan -> {phase order number -> (phase, phase order literal) pairs}
+        self.phase_start_steps = {} #phase -> start steps
+        self.phase_tasks = {} #phase -> tasks
+        self.final_phases = set()
+
+        for s, _, o in graph.triples((None, OR.follows, None)):
+            add_unique(self.next_steps, o, s)
+        for s, _, o in graph.triples((None, OR.followedBy, None)):
+            add_unique(self.next_steps, s, o)
+
+        for s, _, o in graph.triples((None, OR["co-occur"], None)):
+            add_unique(self.co_occurring_steps, s, o)
+            add_unique(self.reverse_co_occurring_steps, o, s)
+
+        for s, _, o in graph.triples((None, OR.phaseOrder, None)):
+            add_unique(self.phase_order, s, o)
+
+        for plan, _, phase in graph.triples((None, OR.hasPhase, None)):
+            for order_no in self.phase_order.get(phase, []):
+                add_unique(self.plan_phases_by_order.setdefault(plan, {}), order_no.toPython(), (phase, order_no))
+
+        for s, _, o in graph.triples((None, OR.phaseStartStep, None)):
+            add_unique(self.phase_start_steps, s, o)
+
+        for s, _, o in graph.triples((None, OR.phaseTask, None)):
+            add_unique(self.phase_tasks, s, o)
+
+        for s, _, o in graph.triples((None, OR.isFinalPhase, None)):
+            if o == Literal(True):
+                self.final_phases.add(s)
+
+
+    def co_occurrence_rows(self, step):
+        """
+        Pair a step with each of its co-occurring steps, as the two OPTIONAL co-occur patterns
+        of the queries do: the reverse direction only binds when the forward one found nothing.
+
+        Args:
+            step (URIRef): The step.
+
+        Returns:
+            list: (step, co-occurring step) pairs, or [(step, None)] if nothing co-occurs.
+        """
+
+        co_occurring_steps = self.co_occurring_steps.get(step) or self.reverse_co_occurring_steps.get(step, [])
+        if not co_occurring_steps:
+            return [(step, None)]
+        return [(step, co_occurring_step) for co_occurring_step in co_occurring_steps]
+
+
+    def get_next_steps(self, current_steps):
+        """
+        Get the steps following the current steps, with their co-occurring steps.
+
+        Args:
+            current_steps (list): Local names of the current steps.
+
+        Returns:
+            list: Distinct (next step, co-occurring step) rows, like the get_next_steps query.
+        """
+
+        rows = []
+
+        for step in current_steps:
+            for next_step in self.next_steps.get(OR[step], []):
+                for row in self.co_occurrence_rows(next_step):
+                    if row not in rows:
+                        rows.append(row)
+
+        return rows
+
+
+    def get_next_phase_and_phase_order_no(self, current_phase, current_plan):
+        """
+        Get the phase of the plan following the current phase, with its start steps.
+
+        Args:
+            current_phase (str): Local name of the current phase.
+            current_plan (str): Local name of the current plan.
+
+        Returns:
+            list: Distinct NextPhaseRow rows, like the get_next_phase_and_phase_order_no query.
+        """
+
+        rows = []
+        phases_by_order = self.plan_phases_by_order.get(OR[current_plan], {})
+
+        for current_phase_no in self.phase_order.get(OR[current_phase], []):
+            for next_phase, next_phase_no in phases_by_order.get(current_phase_no.toPython() + 1, []):
+                for first_step in self.phase_start_steps.get(next_phase, []):
+                    for _, co_occurring_step in self.co_occurrence_rows(first_step):
+                        row = NextPhaseRow(next_phase, current_phase_no, next_phase_no, first_step, co_occurring_step)
+                        if row not in rows:
+                            rows.append(row)
+
+        return rows
+
+
+    def get_phase_tasks(self, phase):
+        """
+        Get the tasks of a phase.
+
+        Args:
+            phase (str): Local name of the phase.
+
+        Returns:
+            list: Task URIs of the phase.
+        """
+
+        return self.phase_tasks.get(OR[phase], [])
+
+
+    def is_final_phase(self, phase):
+        """
+        Check whether a phase is marked as the final phase.
+
+        Args:
+            phase (str): Local name of the phase.
+
+        Returns:
+            bool: True if the phase is the final phase, False otherwise.
+        """
+
+        return OR[phase] in self.final_phases
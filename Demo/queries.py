@@ -1,172 +1,221 @@
-from rdflib import Graph
+from rdflib import Namespace
+from rdflib.namespace import RDF
+from rdflib.plugins.sparql import prepareQuery
 
-def get_all_existing_tools():
-    all_existing_tools = """
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
+#local imports
+from instrumentation import metrics
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+NAMESPACES = {"rdf": RDF, "or": OR}
+
+#Query registry: every query is parsed and algebrized once, at import time. Parameters
+#(steps, phases, plans) are passed as initBindings at execution time, never interpolated.
+QUERIES = {
+    "all_existing_tools": """
     select distinct ?tool where {
         ?step or:toolUsed ?tool .
     } limit 100
-    """
-    return all_existing_tools
+    """,
 
-def retrieve_all_steps():
-    all_steps = """
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
+    "all_steps": """
     select ?step where {
         ?step a or:Step .
     } limit 100
-    """
-    return all_steps
-
-def get_next_steps(current_steps): 
-    step_conditions = ",".join(f"or:{step}" for step in current_steps)
+    """,
 
-    next_steps = f"""
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?next_step ?co_occurring_step WHERE {{
-        {{
-            # Condition 1: Find steps that follow any of the current steps
+    "next_steps": """
+    SELECT DISTINCT ?next_step ?co_occurring_step WHERE {
+        {
+            # Condition 1: Find steps that follow the current step
             ?next_step or:follows ?current_step .
-            FILTER(?current_step IN ({step_conditions}))
-
-        }}
+        }
         UNION
-        {{
-            # Condition 2: Find steps that are followed by any of the current steps
+        {
+            # Condition 2: Find steps that are followed by the current step
             ?current_step or:followedBy ?next_step .
-            FILTER(?current_step IN ({step_conditions}))
-
-        }}
-        OPTIONAL {{
+        }
+        OPTIONAL {
             # Condition 3: Find co-occurring steps
             ?next_step or:co-occur ?co_occurring_step .
 
-        }}
-        OPTIONAL {{
+        }
+        OPTIONAL {
             # Co-occurrence in the reverse direction
             ?co_occurring_step or:co-occur ?next_step .
-        }}
-    }} LIMIT 100
-    """
-    return next_steps
-
-def get_next_phase_and_phase_order_no(current_phase, current_plan):
-    
-    result = f"""PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?next_phase ?current_phase_no ?next_phase_no ?first_step ?co_occurring_step WHERE {{
-        or:{current_phase} or:phaseOrder ?current_phase_no .
+        }
+    } LIMIT 100
+    """,
+
+    "next_phase_and_phase_order_no": """
+    SELECT DISTINCT ?next_phase ?current_phase_no ?next_phase_no ?first_step ?co_occurring_step WHERE {
+        ?current_phase or:phaseOrder ?current_phase_no .
         ?next_phase or:phaseOrder ?next_phase_no .
         FILTER (?next_phase_no = ?current_phase_no + 1).
-        or:{current_plan} or:hasPhase ?next_phase .
-        
+        ?current_plan or:hasPhase ?next_phase .
+
         ?next_phase or:phaseStartStep ?first_step .
-        
-        OPTIONAL {{
+
+        OPTIONAL {
             ?first_step or:co-occur ?co_occurring_step .
 
-        }}
-        OPTIONAL {{
+        }
+        OPTIONAL {
             ?co_occurring_step or:co-occur ?first_step .
-        }}
-    }} LIMIT 100"""
-    return result
-
-def get_phase_task(phase):
-    result = f"""PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?task WHERE {{
-    or:{phase} or:phaseTask ?task
-    }}
-    LIMIT 100"""
-    return result
-
-def get_step_action(step):
-    result = f"""PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?action WHERE {{
-    or:{step} or:stepAction ?action
-    }}
-    LIMIT 100"""
-    return result
-
-def is_final_phase(current_phase):
-    result = f"""
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    ASK WHERE {{
-        or:{current_phase} or:isFinalPhase true .
-    }}
-    """
-    return result
-
-def get_tools_for_steps(steps):
-    step_conditions = ",".join(f"or:{step}" for step in steps)
-    result = f"""
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?tool WHERE {{
-        {{
+        }
+    } LIMIT 100""",
+
+    "phase_task": """
+    SELECT DISTINCT ?task WHERE {
+    ?phase or:phaseTask ?task
+    }
+    LIMIT 100""",
+
+    "step_action": """
+    SELECT DISTINCT ?action WHERE {
+    ?step or:stepAction ?action
+    }
+    LIMIT 100""",
+
+    "all_step_actions": """
+    SELECT DISTINCT ?step ?action WHERE {
+    ?step or:stepAction ?action
+    }""",
+
+    "is_final_phase": """
+    ASK WHERE {
+        ?current_phase or:isFinalPhase true .
+    }
+    """,
+
+    "tools_for_steps": """
+    SELECT DISTINCT ?tool WHERE {
+        {
             ?step or:toolUsed ?tool .
-            FILTER(?step IN ({step_conditions}))
-        }}
+        }
         UNION
-        {{
+        {
             ?tool or:toolUsedInStep ?step .
-            FILTER(?current_step IN ({step_conditions}))
-        }}
-    }} LIMIT 100
-    """
-    return result
+        }
+    } LIMIT 100
+    """,
 
-def get_actors_for_steps(steps):
-    step_conditions = ",".join(f"or:{step}" for step in steps)
-    result = f"""
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?actor WHERE {{
-        {{
+    "actors_for_steps": """
+    SELECT DISTINCT ?actor WHERE {
+        {
             ?step or:actor ?actor .
-            FILTER(?step IN ({step_conditions}))
-        }}
+        }
         UNION
-        {{
+        {
             ?actor or:actsIn ?step .
-            FILTER(?current_step IN ({step_conditions}))
-        }}
-    }} LIMIT 100
-    """
-    return result
+        }
+    } LIMIT 100
+    """,
 
-def get_capabilities_for_steps(steps):
-    step_conditions = ",".join(f"or:{step}" for step in steps)
-    result = f"""
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?capability WHERE {{
-        {{
+    "capabilities_for_steps": """
+    SELECT DISTINCT ?capability WHERE {
+        {
             ?step or:requiresCapability ?capability .
-            FILTER(?step IN ({step_conditions}))
-        }}
-    }} LIMIT 100
+        }
+    } LIMIT 100
+    """,
+
+    "materials_for_steps": """
+    SELECT DISTINCT ?material WHERE {
+        {
+            ?step or:materialUsed ?material .
+        }
+    } LIMIT 100
+    """,
+}
+
+QUERIES = {name: prepareQuery(query, initNs=NAMESPACES) for name, query in QUERIES.items()}
+
+
+def run_query(graph, query_name, **bindings):
     """
-    return result
+    Execute a prepared query from the registry, recording its latency as "query.<name>".
 
-def get_materials_for_steps(steps):
-    step_conditions = ",".join(f"or:{step}" for step in steps)
-    result = f"""
-    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX or: <http://www.semanticweb.org/Twin_OR/>
-    SELECT DISTINCT ?material WHERE {{
-        {{
-            ?step or:rmaterialUsed ?material .
-            FILTER(?step IN ({step_conditions}))
-        }}
-    }} LIMIT 100
+    Args:
+        graph (rdflib.Graph): The graph to query.
+        query_name (str): Name of the query in `QUERIES`.
+        **bindings: Local names (e.g. "Step_A1_1") of the individuals to bind to the
+            query variables of the same name.
+
+    Returns:
+        rdflib.query.Result: The query result.
     """
+
+    init_bindings = {variable: OR[local_name] for variable, local_name in bindings.items()}
+
+    with metrics.span("query." + query_name):
+        result = graph.query(QUERIES[query_name], initBindings=init_bindings)
+        result.bindings #evaluate the query inside the span; the rows are kept for iteration
+
     return result
 
-    
+
+def run_query_for_steps(graph, query_name, steps, variable="step"):
+    """
+    Execute a prepared query once per step and merge the results.
+
+    Equivalent to running the query with `FILTER(?step IN (...))`: the rows of all steps
+    are concatenated in step order with duplicate rows removed.
+
+    Args:
+        graph (rdflib.Graph): The graph to query.
+        query_name (str): Name of the query in `QUERIES`.
+        steps (list): Local names of the steps.
+        variable (str, optional): The query variable the step is bound to. Defaults to "step".
+
+    Returns:
+        list: The distinct result rows.
+    """
+
+    rows = []
+    seen_rows = set()
+
+    for step in steps:
+        for row in run_query(graph, query_name, **{variable: step}):
+            if row not in seen_rows:
+                seen_rows.add(row)
+                rows.append(row)
+
+    return rows
+
+
+def get_all_existing_tools(graph):
+    return run_query(graph, "all_existing_tools")
+
+def retrieve_all_steps(graph):
+    return run_query(graph, "all_steps")
+
+def get_next_steps(graph, current_steps):
+    return run_query_for_steps(graph, "next_steps", current_steps, variable="current_step")
+
+def get_next_phase_and_phase_order_no(graph, current_phase, current_plan):
+    return run_query(graph, "next_phase_and_phase_order_no", current_phase=current_phase, current_plan=current_plan)
+
+def get_phase_task(graph, phase):
+    return run_query(graph, "phase_task", phase=phase)
+
+def get_step_action(graph, step):
+    return run_query(graph, "step_action", step=step)
+
+def get_all_step_actions(graph):
+    return run_query(graph, "all_step_actions")
+
+def is_final_phase(graph, current_phase):
+    return bool(run_query(graph, "is_final_phase", current_phase=current_phase))
+
+def get_tools_for_steps(graph, steps):
+    return run_query_for_steps(graph, "tools_for_steps", steps)
+
+def get_actors_for_steps(graph, steps):
+    return run_query_for_steps(graph, "actors_for_steps", steps)
+
+def get_capabilities_for_steps(graph, steps):
+    return run_query_for_steps(graph, "capabilities_for_steps", steps)
+
+def get_materials_for_steps(graph, steps):
+    return run_query_for_steps(graph, "materials_for_steps", steps)
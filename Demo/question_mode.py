@@ -1,14 +1,97 @@
-import queries
-from ontology_utils import query_result_to_list
+from collections import OrderedDict
+from ontology_utils import get_label_from_uri
 import re
 
+
+class AnswerCache:
+    """
+    Bounded LRU cache of question mode answers.
+
+    Keys include the graph version of the simulator, which is bumped on every change of the
+    ontology graph, so answers computed before a sensor update are never served after it;
+    they are simply no longer looked up and age out of the cache.
+
+    Args:
+        maxsize (int, optional): Maximum number of cached answers. Defaults to 256.
+    """
+
+    def __init__(self, maxsize=256):
+
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key, compute):
+        """
+        Get a cached answer, computing and caching it on a miss.
+
+        Args:
+            key (tuple): The cache key.
+            compute (callable): Computes the answer without arguments.
+
+        Returns:
+            The answer.
+        """
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        self.misses += 1
+        answer = compute()
+        self.entries[key] = answer
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return answer
+
+
+def get_cached_next_steps(or_simulator_instance):
+    """
+    Get the next steps of the current steps through the simulator's answer cache.
+
+    Args:
+        or_simulator_instance (ORSimulator): The simulator.
+
+    Returns:
+        list: Labels of the next steps.
+    """
+
+    current_steps = or_simulator_instance.current_steps
+    key = ("next_steps", tuple(current_steps), or_simulator_instance.graph_version)
+    return or_simulator_instance.answer_cache.get(key, lambda: or_simulator_instance.get_next_steps(current_steps))
+
+
+def get_cached_resources_for_steps(or_simulator_instance, kind, steps):
+    """
+    Get the tools, capabilities, actors or materials of steps from the step resource profiles,
+    through the simulator's answer cache.
+
+    Args:
+        or_simulator_instance (ORSimulator): The simulator.
+        kind (str): "tools", "capabilities", "actors" or "materials".
+        steps (list): Labels of the steps.
+
+    Returns:
+        list: Labels of the resources.
+    """
+
+    key = (kind, tuple(steps), or_simulator_instance.graph_version)
+    step_profiles = or_simulator_instance.get_step_profiles()
+    return or_simulator_instance.answer_cache.get(
+        key, lambda: [get_label_from_uri(resource) for resource in step_profiles.get_resources(kind, steps)])
+
+
 def question_mode(or_simulator_instance, question):
     """
     Handle user questions during simulation.
 
     Processes user questions related to the next steps in the procedure, such as 
     tools, actors, capabilities, or materials required. Utilizes the simulation 
-    instance to retrieve relevant information and provides detailed responses.
+    instance to retrieve relevant information and provides detailed responses. 
+    Answers are memoized in the simulator's answer cache until the graph changes.
 
     Args:
         or_simulator_instance (ORSimulator): The instance of the simulator handling 
@@ -24,30 +107,26 @@ def question_mode(or_simulator_instance, question):
 
     #Questions about the next step
     if 'next step' in question:
-        next_steps = or_simulator_instance.get_next_steps(or_simulator_instance.current_steps)
+        next_steps = get_cached_next_steps(or_simulator_instance)
         
         if len(next_steps) == 0:
             print("There are no more steps to perform in this phase.")
         elif 'tool' in question: #ask about tools for next step
-            
-            query_result = or_simulator_instance.or_graph.query(queries.get_tools_for_steps(next_steps))
-            next_step_tools = query_result_to_list(query_result)
+            next_step_tools = get_cached_resources_for_steps(or_simulator_instance, "tools", next_steps)
             
             if len(next_step_tools) == 0:
                 print("I don't know of any tools needed for the next step.")
             else:
                 print(f"Tools needed for the next step: {', '.join(next_step_tools)}")
         elif 'capability' in question or 'capabilities' in question: #ask about capabilities necessary for next step
-            query_result = or_simulator_instance.or_graph.query(queries.get_capabilities_for_steps(next_steps))
-            next_step_capabilities = query_result_to_list(query_result)   
+            next_step_capabilities = get_cached_resources_for_steps(or_simulator_instance, "capabilities", next_steps)
 
             if len(next_step_capabilities) == 0:
                 print("I don't know of any capabilities needed for the next step.")
             else:
                 print(f"Actors in the next step(s) must have the following capabilities: {', '.join(next_step_capabilities)}")
         elif 'actor' in question: #ask about which actors need to be present
-            query_result = or_simulator_instance.or_graph.query(queries.get_actors_for_steps(next_steps))
-            next_step_actors = query_result_to_list(query_result)
+            next_step_actors = get_cached_resources_for_steps(or_simulator_instance, "actors", next_steps)
 
             if len(next_step_actors) == 0:
                 print("I don't know of any actors needed for the next step.")
@@ -55,8 +134,7 @@ def question_mode(or_simulator_instance, question):
                 print(f"Actors needed for the next step: {', '.join(next_step_actors)}")
 
         elif 'material' in question: #ask about materials needed for next step
-            query_result = or_simulator_instance.or_graph.query(queries.get_materials_for_steps(next_steps))
-            next_step_materials = query_result_to_list(query_result)   
+            next_step_materials = get_cached_resources_for_steps(or_simulator_instance, "materials", next_steps)
 
             if len(next_step_materials) == 0:
                 print("I don't know of any materials needed for the next step.")
@@ -79,7 +157,7 @@ def question_mode(or_simulator_instance, question):
         if contains_integer:
             print(f"Setting camera angle to position {int(match.group())}...")
         else:
-            position = input("What position would you like to set the camera to? ")
+            position = or_simulator_instance.prompt("What position would you like to set the camera to? ")
             print(f"Setting camera angle to position {position}...")
     else:
         print("Sorry, I don't know how to answer that question.")
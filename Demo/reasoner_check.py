@@ -0,0 +1,92 @@
+import argparse
+import json
+import tempfile
+from rdflib import Graph, BNode
+
+#local imports
+from benchmark import benchmark_materialization
+from materializer import IncrementalMaterializer
+
+
+def get_entailments(graph):
+    """
+    Get the ground triples a materialized graph entails under the in-process rules.
+
+    owlready2 writes only the most specific inferred classes of an individual, so reasoner
+    outputs are closed under the rules of `materializer.py` before they are compared.
+    Triples with blank nodes (class expressions, property chain lists) are left out, since
+    their node IDs differ from run to run.
+
+    Args:
+        graph (rdflib.Graph): A materialized ontology graph.
+
+    Returns:
+        set: The entailed triples without blank nodes.
+    """
+
+    closure = Graph()
+    closure.addN((s, p, o, closure) for s, p, o in graph)
+    IncrementalMaterializer(closure)
+
+    return {triple for triple in closure if not any(isinstance(term, BNode) for term in triple)}
+
+
+def check_consistency(graph, reference_graph):
+    """
+    Compare the in-process materialization of an ontology with a reference reasoner's.
+
+    Args:
+        graph (rdflib.Graph): The ontology materialized with reasoner="python".
+        reference_graph (rdflib.Graph): The ontology materialized with the reference reasoner.
+
+    Returns:
+        dict: Whether both entail the same triples, and the triples only the reference
+        entails ("missing") or only the in-process reasoner entails ("extra"), as N-Triples.
+    """
+
+    entailments = get_entailments(graph)
+    reference_entailments = get_entailments(reference_graph)
+
+    missing = sorted(" ".join(term.n3() for term in triple) for triple in reference_entailments - entailments)
+    extra = sorted(" ".join(term.n3() for term in triple) for triple in entailments - reference_entailments)
+
+    return {"consistent": not missing and not extra, "missing": missing, "extra": extra}
+
+
+def run_check(ontology_path, reference_reasoner, repeat):
+    """
+    Time the in-process reasoner against a reference reasoner and compare their outputs.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        reference_reasoner (str): "hermit" or "pellet".
+        repeat (int): Runs per reasoner.
+
+    Returns:
+        dict: "load_and_materialize" -> reasoner -> timing summary (or error), and
+        "consistency" -> the outcome of `check_consistency`, or the reason it could not run.
+    """
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        timings, materialized_paths = benchmark_materialization(ontology_path, ["python", reference_reasoner], repeat, work_dir)
+        results = {"load_and_materialize": timings}
+
+        if reference_reasoner not in materialized_paths or "python" not in materialized_paths:
+            results["consistency"] = {"error": "materialization failed, see load_and_materialize"}
+            return results
+
+        graph = Graph().parse(materialized_paths["python"], format="nt")
+        reference_graph = Graph().parse(materialized_paths[reference_reasoner], format="nt")
+        results["consistency"] = check_consistency(graph, reference_graph)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the in-process reasoner against HermiT or Pellet.")
+    parser.add_argument("ontology", nargs="?", default="or_ontology.owl", help="ontology file")
+    parser.add_argument("--reference", default="hermit", choices=["hermit", "pellet"], help="reference reasoner")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per reasoner")
+    arguments = parser.parse_args()
+
+    print(json.dumps(run_check(arguments.ontology, arguments.reference, arguments.repeat), indent=4))
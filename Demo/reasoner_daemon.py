@@ -0,0 +1,174 @@
+import io
+from concurrent.futures import ProcessPoolExecutor
+from owlready2 import World, sync_reasoner, sync_reasoner_pellet
+from rdflib import Graph, BNode
+
+#local imports
+from ontology_utils import load_and_materialize_ontology, apply_changes, REASONER_FLAGS
+from materializer import IncrementalMaterializer
+from overlay_store import overlay_graph, OverlaySet
+
+#State of the daemon process: the asserted and the materialized base ontology, loaded once by init_reasoner
+reasoner_state = {}
+
+
+def init_reasoner(ontology_path, reasoner, cache_dir):
+    """
+    Load and materialize the base ontology in the daemon process.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        reasoner (str): "hermit", "pellet" or "python".
+        cache_dir (str): Directory of the materialization cache, or None.
+    """
+
+    asserted_graph = load_and_materialize_ontology(ontology_path, reasoner="none", cache_dir=cache_dir)
+    reasoner_state["reasoner"] = reasoner
+    reasoner_state["asserted_graph"] = asserted_graph
+
+    if reasoner == "python": #keep track of what is inferred, so deltas can be materialized incrementally
+        base_graph = Graph()
+        base_graph.addN((s, p, o, base_graph) for s, p, o in asserted_graph)
+        reasoner_state["inferred"] = IncrementalMaterializer(base_graph).inferred
+    else:
+        base_graph = load_and_materialize_ontology(ontology_path, reasoner=reasoner, cache_dir=cache_dir)
+    reasoner_state["base_graph"] = base_graph
+
+
+def get_base_triples():
+    """
+    Get the triples of the materialized base ontology (daemon process).
+
+    Returns:
+        list: The triples.
+    """
+
+    return list(reasoner_state["base_graph"])
+
+
+def reason_over_changes(changes):
+    """
+    Materialize the base ontology with changes applied (daemon process).
+
+    With the Python reasoner, the consequences of the changes are materialized incrementally
+    on an overlay of the materialized base. With HermiT or Pellet, the asserted base with the
+    changes applied is handed to a fresh owlready2 world and the reasoner runs over it; triples
+    with blank nodes (class expressions) are taken from the base materialization.
+
+    Args:
+        changes (list): (action, triple) pairs relative to the asserted base ontology.
+
+    Returns:
+        list: (action, triple) pairs turning the materialized base into the materialized
+        ontology with the changes applied.
+    """
+
+    if reasoner_state["reasoner"] == "python":
+        graph = overlay_graph(reasoner_state["base_graph"])
+        materializer = IncrementalMaterializer(graph, inferred=OverlaySet(reasoner_state["inferred"]))
+        materializer.promote(changes)
+        materializer.update(apply_changes(graph, changes))
+        return graph.store.changes()
+
+    graph = overlay_graph(reasoner_state["asserted_graph"])
+    apply_changes(graph, changes)
+
+    world = World()
+    ontology = world.get_ontology("http://localhost/reasoner_daemon/").load(fileobj=io.BytesIO(graph.serialize(format="nt", encoding="utf-8")))
+    with ontology:
+        if reasoner_state["reasoner"] == "hermit":
+            sync_reasoner(world, **REASONER_FLAGS["hermit"])
+        elif reasoner_state["reasoner"] == "pellet":
+            sync_reasoner_pellet(world, **REASONER_FLAGS["pellet"])
+
+    buffer = io.BytesIO()
+    ontology.save(buffer, format="ntriples")
+    materialized_graph = Graph()
+    materialized_graph.parse(data=buffer.getvalue(), format="nt")
+    world.close()
+
+    has_blank_node = lambda triple: any(isinstance(term, BNode) for term in triple)
+    base_graph = reasoner_state["base_graph"]
+
+    return ([("remove", triple) for triple in base_graph if not has_blank_node(triple) and triple not in materialized_graph]
+            + [("add", triple) for triple in materialized_graph if not has_blank_node(triple) and triple not in base_graph])
+
+
+class ReasonerDaemon:
+    """
+    Long-lived reasoner process, reasoning over a preloaded base ontology plus deltas.
+
+    The daemon process loads and materializes the base ontology once; afterwards each request
+    only pays for reasoning over the base plus its delta, not for starting Python, importing
+    owlready2 and loading the ontology. With the Python reasoner a request costs a few
+    milliseconds. With HermiT and Pellet the JVM startup is NOT amortized: owlready2 starts a
+    new JVM for every reasoner run, so each request still pays for it (keeping one JVM alive
+    would take a reasoner server on the Java side). Requests are sent over the pipes of a
+    single-worker process pool and return futures, so several rooms can share the daemon.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        reasoner (str, optional): "hermit", "pellet" or "python". Defaults to "hermit".
+        cache_dir (str, optional): Directory of the materialization cache. Defaults to None.
+    """
+
+    def __init__(self, ontology_path, reasoner="hermit", cache_dir=None):
+
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=init_reasoner, initargs=(ontology_path, reasoner, cache_dir))
+        self.base_graph = None
+
+
+    def get_base_graph(self):
+        """
+        Get the materialized base ontology, fetching it from the daemon on first use.
+
+        Returns:
+            rdflib.Graph: The materialized base ontology (shared; not to be modified).
+        """
+
+        if self.base_graph is None:
+            base_graph = Graph()
+            base_graph.addN((s, p, o, base_graph) for s, p, o in self.executor.submit(get_base_triples).result())
+            self.base_graph = base_graph
+        return self.base_graph
+
+
+    def submit(self, changes):
+        """
+        Request the materialization of the base ontology with changes applied.
+
+        Args:
+            changes (list): (action, triple) pairs relative to the asserted base ontology.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the (action, triple) pairs turning the
+            materialized base into the materialized result.
+        """
+
+        return self.executor.submit(reason_over_changes, list(changes))
+
+
+    def materialize(self, changes=()):
+        """
+        Materialize the base ontology with changes applied.
+
+        Args:
+            changes (list, optional): (action, triple) pairs relative to the asserted base
+                ontology. Defaults to ().
+
+        Returns:
+            rdflib.Graph: An overlay of the materialized base holding the result.
+        """
+
+        materialized_changes = self.submit(changes).result()
+        graph = overlay_graph(self.get_base_graph())
+        apply_changes(graph, materialized_changes)
+        return graph
+
+
+    def shutdown(self):
+        """
+        Stop the daemon process.
+        """
+
+        self.executor.shutdown()
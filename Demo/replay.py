@@ -0,0 +1,191 @@
+import contextlib
+import io
+import json
+import sys
+from multiprocessing import Pool
+from rdflib import Graph, Namespace
+
+#local imports
+from ontology_utils import load_and_materialize_ontology, parse_json_to_rdflib
+from procedure_index import ProcedureIndex
+from compact_store import CompactStore
+from OR_simulator import ORSimulator, prepare_base_graph
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+
+class ProcedureReplayer:
+    """
+    Headless, full-speed replay of recorded procedures.
+
+    A script is a JSON list of events, replayed after the procedure's first step:
+        {"event": "advance"}                                  like pressing 'Tab'
+        {"event": "question", "question": "..."}              like pressing '?' and asking
+        {"event": "sensor", "action": "add", "triples": [...]} sensor data (sensor_data.json format)
+        {"event": "validate"}                                 validate the streamed sensor data
+        {"event": "terminate"}                                like pressing 'esc'
+    Any event may carry "answers": the replies to the prompts it raises (violation messages,
+    camera position), in order; a prompt without a recorded answer gets an empty reply.
+
+    No keyboard listener is started, prompts are answered from the script and pauses are
+    skipped. The ontology is loaded once and every replay runs on an overlay of it (sharing
+    the inferences of the ontology the options need, see `prepare_base_graph`), so replays
+    only cost the procedure itself.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        cache_dir (str, optional): Directory of the materialization cache. Defaults to None.
+        base_graph (rdflib.Graph, optional): The already materialized ontology; if given, it is
+            used instead of loading the ontology. Defaults to None.
+        reasoner (str, optional): Reasoner the ontology is materialized with. Defaults to "none",
+            as for ORSimulator.
+        **simulator_options: Further ORSimulator options (e.g. the validation modes).
+    """
+
+    def __init__(self, ontology_path, shacl_shape_path, cache_dir=None, base_graph=None, reasoner="none", **simulator_options):
+
+        self.ontology_path = ontology_path
+        self.shacl_shape_path = shacl_shape_path
+        self.simulator_options = simulator_options
+        if base_graph is None:
+            base_graph = load_and_materialize_ontology(ontology_path, reasoner=reasoner, cache_dir=cache_dir)
+        if simulator_options.get("compact_store") and not isinstance(base_graph.store, CompactStore):
+            base_graph = Graph(store=CompactStore(base_graph))
+        self.base_graph = base_graph
+        self.shared_base = prepare_base_graph(base_graph, simulator_options) #ORSimulator arguments of every replay
+        self.procedure_index = ProcedureIndex(self.shared_base["base_graph"])
+
+
+    def replay(self, script):
+        """
+        Replay a recorded procedure.
+
+        Args:
+            script (list): The recorded events.
+
+        Returns:
+            list: The trace, one dict per event (the first for the procedure start) with the
+            event, the prompts and their answers, the validations run (conforms flags), the
+            printed output lines, and the procedure state after the event.
+        """
+
+        simulator = ORSimulator(self.ontology_path, self.shacl_shape_path, **self.shared_base, **self.simulator_options)
+        simulator.procedure_index = self.procedure_index
+        simulator.pause = lambda seconds: None
+
+        answers = []
+        prompts = []
+        validations = []
+
+        def prompt(message=""):
+            answer = answers.pop(0) if answers else ""
+            prompts.append({"prompt": message, "answer": answer})
+            print(message) #as a console shows it
+            return answer
+
+        def validate():
+            is_valid, validation_report = ORSimulator.validate(simulator)
+            validations.append(is_valid)
+            return is_valid, validation_report
+
+        simulator.prompt = prompt
+        simulator.validate = validate
+
+        trace = []
+        events = [{"event": "start"}] + list(script)
+
+        for index, event in enumerate(events):
+            #in question mode, the question itself is the first prompt
+            answers[:] = ([event.get("question", "")] if event["event"] == "question" else []) + event.get("answers", [])
+            prompts.clear()
+            validations.clear()
+            output = io.StringIO()
+
+            with contextlib.redirect_stdout(output):
+                self.replay_event(simulator, event)
+                #handle what the event queued (e.g. results of asynchronous validations)
+                while not simulator.events.empty():
+                    simulator.handle_event(*simulator.events.get())
+
+            trace.append({
+                "index": index,
+                "event": event["event"],
+                "prompts": list(prompts),
+                "validations": list(validations),
+                "output": output.getvalue().splitlines(),
+                "current_phase": simulator.current_phase,
+                "current_steps": list(simulator.current_steps),
+                "ongoing_procedure": simulator.ongoing_procedure,
+            })
+
+            if not simulator.ongoing_procedure:
+                break
+
+        return trace
+
+
+    def replay_event(self, simulator, event):
+        """
+        Replay one recorded event on a simulator.
+
+        Args:
+            simulator (ORSimulator): The simulator running the procedure.
+            event (dict): The recorded event.
+        """
+
+        if event["event"] == "start":
+            simulator.intro_message()
+            simulator.start_procedure()
+        elif event["event"] == "sensor":
+            changes = [(event.get("action"), parse_json_to_rdflib(triple, OR, simulator.term_cache)) for triple in event.get("triples", [])]
+            simulator.handle_event("sensor", changes)
+        else:
+            simulator.handle_event(event["event"])
+
+
+#Replayer of a worker process of `replay_many`
+worker_replayer = None
+
+
+def init_replay_worker(ontology_path, shacl_shape_path, cache_dir, simulator_options):
+    global worker_replayer
+    worker_replayer = ProcedureReplayer(ontology_path, shacl_shape_path, cache_dir=cache_dir, **simulator_options)
+
+
+def replay_in_worker(script):
+    return worker_replayer.replay(script)
+
+
+def replay_many(ontology_path, shacl_shape_path, scripts, cache_dir=None, processes=None, **simulator_options):
+    """
+    Replay many recorded procedures in a pool of worker processes.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        scripts (iterable): The recorded scripts.
+        cache_dir (str, optional): Directory of the materialization cache. Defaults to None.
+        processes (int, optional): Number of worker processes. Defaults to None (one per CPU).
+        **simulator_options: Further ORSimulator options.
+
+    Yields:
+        list: The trace of each script, in order.
+    """
+
+    with Pool(processes, initializer=init_replay_worker,
+              initargs=(ontology_path, shacl_shape_path, cache_dir, simulator_options)) as pool:
+        yield from pool.imap(replay_in_worker, scripts)
+
+
+if __name__ == "__main__":
+    #Usage: python replay.py script.json [repeat] > trace.ndjson
+    with open(sys.argv[1]) as file:
+        script = json.load(file)
+
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    options = {"cache_dir": "materialization_cache", "native_validation": True, "incremental_validation": True}
+
+    for run, trace in enumerate(replay_many('or_ontology.owl', 'SHACL_constraints.ttl', [script] * repeat, **options)):
+        for entry in trace:
+            print(json.dumps(dict(entry, run=run)))
@@ -1,6 +1,6 @@
 from OR_simulator import ORSimulator
 
-simulator = ORSimulator('or_ontology.owl', 'SHACL_constraints.ttl')
+simulator = ORSimulator('or_ontology.owl', 'SHACL_constraints.ttl', cache_dir='materialization_cache')
 
 # Run a method to test the class
 simulator.run_simulation()
\ No newline at end of file
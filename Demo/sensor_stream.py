@@ -0,0 +1,287 @@
+import json
+import queue
+import re
+import socket
+import sys
+import threading
+import time
+from rdflib import Namespace
+
+#local imports
+from ontology_utils import parse_json_to_rdflib
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+#Local names of ontology terms a sensor message may refer to (e.g. Step_A5_1, co-occur)
+LOCAL_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_.\-]*")
+
+
+def parse_sensor_message(line, namespace=OR, term_cache=None):
+    """
+    Convert one newline-delimited JSON sensor message to graph changes.
+
+    A message is either a single triple with an action, e.g.
+    {"action": "add", "subject": "Step_A5_1", "predicate": "correctAlignment", "object": false},
+    or an entry in the format of sensor_data.json: {"action": "add", "triples": [...]}.
+
+    Args:
+        line (str): The JSON message.
+        namespace (Namespace, optional): RDFLib Namespace object for the ontology. Defaults to OR.
+        term_cache (dict, optional): Interned RDFLib terms reused across messages. Defaults to None.
+
+    Returns:
+        list: (action, triple) pairs; empty for blank lines and unknown actions.
+
+    Raises:
+        ValueError: If the message is not valid JSON or a triple is malformed (see
+            `check_sensor_triple`).
+    """
+
+    line = line.strip()
+    if not line:
+        return []
+
+    message = json.loads(line)
+    action = message.get("action")
+
+    if action not in ("add", "remove"):
+        return []
+
+    triples = message.get("triples", [message])
+    if not isinstance(triples, list):
+        raise ValueError("'triples' must be a list")
+
+    for triple in triples:
+        check_sensor_triple(triple)
+
+    return [(action, parse_json_to_rdflib(triple, namespace, term_cache)) for triple in triples]
+
+
+def check_sensor_triple(triple):
+    """
+    Check that a JSON triple of a sensor message can be converted to an RDFLib triple.
+
+    The subject and predicate must be local names of the ontology namespace, the object a
+    local name or a boolean.
+
+    Args:
+        triple (dict): A JSON representation of a triple.
+
+    Raises:
+        ValueError: If the triple is malformed.
+    """
+
+    if not isinstance(triple, dict):
+        raise ValueError("a triple must be a JSON object")
+
+    for key in ("subject", "predicate", "object"):
+        value = triple.get(key)
+        if key == "object" and isinstance(value, bool):
+            continue
+        if not isinstance(value, str) or not LOCAL_NAME.fullmatch(value):
+            raise ValueError(f"invalid {key} {value!r}")
+
+
+def follow_file(path, poll_interval=0.05, stop_event=None):
+    """
+    Yield the lines of a file as they are appended to it (like `tail -f`).
+
+    Args:
+        path (str): Path to the file.
+        poll_interval (float, optional): Seconds to wait for new data at the end of the file. Defaults to 0.05.
+        stop_event (threading.Event, optional): Stops following when set. Defaults to None.
+
+    Yields:
+        str: Complete lines of the file.
+    """
+
+    with open(path) as file:
+        partial_line = ""
+        while stop_event is None or not stop_event.is_set():
+            chunk = file.readline()
+            if not chunk:
+                time.sleep(poll_interval)
+                continue
+            partial_line += chunk
+            if partial_line.endswith("\n"):
+                yield partial_line
+                partial_line = ""
+
+
+def open_socket_lines(host, port):
+    """
+    Connect to a TCP sensor feed and return its lines as a file object.
+
+    Args:
+        host (str): Host of the sensor feed.
+        port (int): Port of the sensor feed.
+
+    Returns:
+        file object: Text stream of newline-delimited JSON messages.
+    """
+
+    connection = socket.create_connection((host, port))
+    return connection.makefile("r", encoding="utf-8")
+
+
+class SensorStream:
+    """
+    Streaming ingestion of sensor messages into a running ORSimulator.
+
+    A reader thread parses newline-delimited JSON messages from any iterable of lines (a
+    pipe, a socket file object, or `follow_file` for a growing file). A batching thread
+    coalesces the resulting changes and posts them to the simulator as one "sensor" event
+    per batch, so the graph is updated in bulk instead of per message. A "validate" event
+    is posted at most once per `validation_interval` seconds while changes keep arriving.
+
+    Args:
+        simulator (ORSimulator): The simulator receiving the events.
+        lines (iterable): Source of newline-delimited JSON messages.
+        max_batch_size (int, optional): Changes after which a batch is posted. Defaults to 500.
+        batch_interval (float, optional): Seconds after which a partial batch is posted. Defaults to 0.05.
+        validation_interval (float, optional): Minimum seconds between validations; None disables
+            validation of streamed data. Defaults to 1.0.
+    """
+
+    def __init__(self, simulator, lines, max_batch_size=500, batch_interval=0.05, validation_interval=1.0):
+
+        self.simulator = simulator
+        self.lines = lines
+        self.max_batch_size = max_batch_size
+        self.batch_interval = batch_interval
+        self.validation_interval = validation_interval
+        self.changes = queue.Queue() #parsed (action, triple) pairs, or None at the end of the stream
+        self.stop_event = threading.Event()
+        self.term_cache = simulator.term_cache
+        self.messages_received = 0
+        self.batches_posted = 0
+        self.reader_thread = threading.Thread(target=self.read_lines, daemon=True)
+        self.batcher_thread = threading.Thread(target=self.post_batches, daemon=True)
+
+
+    def start(self):
+        """
+        Start reading and batching sensor messages in the background.
+        """
+
+        self.reader_thread.start()
+        self.batcher_thread.start()
+
+
+    def stop(self):
+        """
+        Stop the stream; changes that were already read are still posted.
+        """
+
+        self.stop_event.set()
+        self.changes.put(None)
+
+
+    def join(self, timeout=None):
+        """
+        Wait until all messages of the stream have been posted to the simulator.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None.
+        """
+
+        self.batcher_thread.join(timeout)
+
+
+    def read_lines(self):
+        """
+        Parse incoming lines into graph changes (reader thread).
+
+        Malformed messages are reported and skipped so one bad message does not stop the feed.
+        """
+
+        for line in self.lines:
+            if self.stop_event.is_set():
+                break
+            try:
+                changes = parse_sensor_message(line, term_cache=self.term_cache)
+            except (ValueError, AttributeError, TypeError) as error:
+                print(f"Skipping malformed sensor message ({error}): {line.strip()}")
+                continue
+
+            self.messages_received += 1
+            for change in changes:
+                self.changes.put(change)
+
+        self.changes.put(None)
+
+
+    def post_batches(self):
+        """
+        Coalesce graph changes into batches and post them to the simulator (batching thread).
+        """
+
+        batch = []
+        batch_started = None
+        last_validation = time.monotonic()
+        pending_validation = False
+        stream_ended = False
+
+        while not stream_ended:
+            timeout = None if batch_started is None else max(0.0, batch_started + self.batch_interval - time.monotonic())
+            try:
+                change = self.changes.get(timeout=timeout)
+            except queue.Empty:
+                change = False
+
+            if change is None:
+                stream_ended = True
+            elif change is not False:
+                batch.append(change)
+                if batch_started is None:
+                    batch_started = time.monotonic()
+                if len(batch) < self.max_batch_size:
+                    continue
+
+            if batch:
+                self.simulator.post_event("sensor", batch)
+                self.batches_posted += 1
+                batch = []
+                batch_started = None
+                pending_validation = True
+
+            if pending_validation and self.validation_interval is not None:
+                now = time.monotonic()
+                if stream_ended or now - last_validation >= self.validation_interval:
+                    self.simulator.post_event("validate")
+                    last_validation = now
+                    pending_validation = False
+
+
+def produce_sensor_messages(sensor_data, output, rate=None, repeat=1):
+    """
+    Local stand-in producer: write sensor_data.json entries as newline-delimited JSON triples.
+
+    Each triple of each step entry becomes one message. Writing to a pipe, a socket file
+    object or an appended file feeds a SensorStream for testing.
+
+    Args:
+        sensor_data (dict): Sensor data in the format of sensor_data.json.
+        output (file object): Text stream to write the messages to.
+        rate (float, optional): Messages per second; None writes as fast as possible. Defaults to None.
+        repeat (int, optional): Number of times to replay the sensor data. Defaults to 1.
+    """
+
+    for _ in range(repeat):
+        for step_data in sensor_data.values():
+            for triple in step_data.get("triples", []):
+                message = dict(triple, action=step_data.get("action"))
+                output.write(json.dumps(message) + "\n")
+                output.flush()
+                if rate:
+                    time.sleep(1.0 / rate)
+
+
+if __name__ == "__main__":
+    #Usage: python sensor_stream.py [messages per second] [repeat] > feed.ndjson
+    with open('sensor_data.json') as file:
+        sensor_data = json.load(file)
+
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    produce_sensor_messages(sensor_data, sys.stdout, rate, repeat)
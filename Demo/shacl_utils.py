@@ -0,0 +1,441 @@
+from rdflib import Graph, URIRef, BNode, Namespace
+from rdflib.namespace import RDF, RDFS
+from pyshacl import validate
+
+#local imports
+from ontology_utils import coalesce_changes, COALESCE_SIZE
+from overlay_store import overlay_graph
+from compact_store import compact_graph
+
+SH = Namespace("http://www.w3.org/ns/shacl#")
+
+#Predicates whose change alters class membership or the schema itself, so shape targets can no longer be derived from the delta alone
+SCHEMA_PREDICATES = {RDF.type, RDFS.subClassOf, RDFS.subPropertyOf, RDFS.domain, RDFS.range}
+
+TARGET_PREDICATES = {SH.targetNode, SH.targetClass, SH.targetSubjectsOf, SH.targetObjectsOf}
+
+CONFORMING_REPORT = "Validation Report\nConforms: True\n"
+
+
+def get_shape_predicates(shapes_graph):
+    """
+    Map every top-level node shape to the predicates its constraints read.
+
+    A shape's predicates are the simple (IRI) paths of its property shapes. Shapes
+    using SPARQL constraints or complex property paths read predicates that cannot
+    be determined statically and are mapped to None (affected by any change).
+
+    Args:
+        shapes_graph (rdflib.Graph): The SHACL shapes graph.
+
+    Returns:
+        dict: Shape URI -> set of predicate URIs, or None if the shape may read any predicate.
+    """
+
+    shape_predicates = {}
+
+    for shape in set(shapes_graph.subjects(RDF.type, SH.NodeShape)):
+        predicates = set()
+
+        if (shape, SH.sparql, None) in shapes_graph:
+            predicates = None
+        else:
+            for property_shape in shapes_graph.objects(shape, SH.property):
+                path = shapes_graph.value(property_shape, SH.path)
+
+                if not isinstance(path, URIRef):
+                    predicates = None
+                    break
+
+                predicates.add(path)
+
+        shape_predicates[shape] = predicates
+
+    return shape_predicates
+
+
+def get_delta_nodes(graph, delta):
+    """
+    Collect the nodes whose validation results a graph delta may have changed.
+
+    These are the subject and object IRIs of the changed triples plus their incoming
+    neighbours, which covers shapes that look up to two hops away from a focus node
+    (e.g. Step -> actor -> capability in StepShape).
+
+    Args:
+        graph (rdflib.Graph): The (already updated) data graph.
+        delta (list): (action, triple) pairs applied since the last validation.
+
+    Returns:
+        set: IRIs of the touched nodes.
+    """
+
+    delta_nodes = set()
+
+    for _, (s, _, o) in delta:
+        for node in (s, o):
+            if isinstance(node, URIRef):
+                delta_nodes.add(node)
+                delta_nodes.update(n for n in graph.subjects(None, node) if isinstance(n, URIRef))
+
+    return delta_nodes
+
+
+def get_rdfs_types(graph, node):
+    """
+    Get the classes a node belongs to under RDFS entailment.
+
+    Combines explicit rdf:type statements with the domains and ranges of the
+    (super)properties the node takes part in and closes them over rdfs:subClassOf.
+
+    Args:
+        graph (rdflib.Graph): The data graph.
+        node (URIRef): The node to classify.
+
+    Returns:
+        set: Class URIs the node is an instance of.
+    """
+
+    direct_types = set(graph.objects(node, RDF.type))
+
+    for predicate in set(graph.predicates(node, None)):
+        for super_property in graph.transitive_objects(predicate, RDFS.subPropertyOf):
+            direct_types.update(graph.objects(super_property, RDFS.domain))
+
+    for predicate in set(graph.predicates(None, node)):
+        for super_property in graph.transitive_objects(predicate, RDFS.subPropertyOf):
+            direct_types.update(graph.objects(super_property, RDFS.range))
+
+    types = set()
+    for direct_type in direct_types:
+        types.update(graph.transitive_objects(direct_type, RDFS.subClassOf))
+
+    return types
+
+
+def get_scoped_shapes_graph(shapes_graph, graph, delta, shape_predicates):
+    """
+    Build a shapes graph that only re-checks what a graph delta may have affected.
+
+    A shape is affected when the delta changes one of the predicates it reads, or,
+    for class-targeted shapes, when a changed predicate has a domain or range (and so
+    may change class membership). Each affected shape is copied with its targets
+    replaced by sh:targetNode statements for the touched nodes it actually targets.
+
+    Args:
+        shapes_graph (rdflib.Graph): The full SHACL shapes graph.
+        graph (rdflib.Graph): The (already updated) data graph.
+        delta (list): (action, triple) pairs applied since the last validation.
+        shape_predicates (dict): Output of `get_shape_predicates` for the shapes graph.
+
+    Returns:
+        rdflib.Graph: The scoped shapes graph (empty if nothing needs re-checking),
+        or None if the delta cannot be scoped and a full validation is required.
+    """
+
+    delta_predicates = {p for _, (_, p, _) in delta}
+
+    if delta_predicates & SCHEMA_PREDICATES:
+        return None
+
+    typing_delta = any((p, RDFS.domain, None) in graph or (p, RDFS.range, None) in graph for p in delta_predicates)
+    delta_nodes = get_delta_nodes(graph, delta)
+    node_types = {}
+    scoped_shapes_graph = Graph()
+
+    for shape, predicates in shape_predicates.items():
+        if (shape, SH.targetSubjectsOf, None) in shapes_graph or (shape, SH.targetObjectsOf, None) in shapes_graph:
+            return None
+
+        target_nodes = set(shapes_graph.objects(shape, SH.targetNode))
+        target_classes = set(shapes_graph.objects(shape, SH.targetClass))
+        reads_delta = predicates is None or bool(predicates & delta_predicates)
+
+        if not reads_delta and not (target_classes and typing_delta):
+            continue
+
+        focus_nodes = delta_nodes & target_nodes
+
+        for node in delta_nodes - focus_nodes:
+            if target_classes:
+                if node not in node_types:
+                    node_types[node] = get_rdfs_types(graph, node)
+                if node_types[node] & target_classes:
+                    focus_nodes.add(node)
+
+        if focus_nodes:
+            copy_shape(shapes_graph, shape, scoped_shapes_graph)
+            for node in focus_nodes:
+                scoped_shapes_graph.add((shape, SH.targetNode, node))
+
+    return scoped_shapes_graph
+
+
+def run_pyshacl(data_graph, shacl_shapes_graph, inference):
+    """
+    Validate a data graph against SHACL shapes with pyshacl.
+
+    Args:
+        data_graph (rdflib.Graph): The graph to validate.
+        shacl_shapes_graph (rdflib.Graph): Shapes to validate against.
+        inference (str): The pyshacl inference option ('rdfs' or 'none').
+
+    Returns:
+        tuple:
+            conforms (bool): True if the graph conforms to the SHACL rules, False otherwise.
+            validation_report (str): A human-readable report detailing validation results.
+    """
+
+    is_valid, _, validation_report = validate(data_graph,
+    shacl_graph= shacl_shapes_graph,
+    ont_graph=None,
+    inference=inference,
+    abort_on_first=False,
+    allow_infos=False,
+    allow_warnings=False,
+    meta_shacl=False,
+    advanced=False,
+    js=False,
+    debug=False)
+
+    return is_valid, validation_report
+
+
+def copy_shape(shapes_graph, shape, target_graph):
+    """
+    Copy a shape and everything it references (blank nodes, nested or named shapes)
+    into another graph, leaving out all target declarations.
+
+    Args:
+        shapes_graph (rdflib.Graph): The graph holding the shape.
+        shape (URIRef or BNode): The shape to copy.
+        target_graph (rdflib.Graph): The graph to copy the shape into.
+
+    Updates:
+        target_graph (rdflib.Graph): Extended with the shape's triples.
+    """
+
+    pending = [shape]
+    visited = set()
+
+    while pending:
+        node = pending.pop()
+        if node in visited:
+            continue
+        visited.add(node)
+
+        for _, p, o in shapes_graph.triples((node, None, None)):
+            if p in TARGET_PREDICATES:
+                continue
+            target_graph.add((node, p, o))
+            if isinstance(o, (URIRef, BNode)) and (o, None, None) in shapes_graph:
+                pending.append(o)
+
+
+def copy_shape_targets(shapes_graph, shape, target_graph):
+    """
+    Copy the target declarations of a shape into another graph.
+
+    Args:
+        shapes_graph (rdflib.Graph): The graph holding the shape.
+        shape (URIRef or BNode): The shape whose targets to copy.
+        target_graph (rdflib.Graph): The graph to copy the targets into.
+    """
+
+    for target_predicate in TARGET_PREDICATES:
+        for target in shapes_graph.objects(shape, target_predicate):
+            target_graph.add((shape, target_predicate, target))
+
+
+def split_shapes_graph(shapes_graph, group_count):
+    """
+    Split the node shapes of a shapes graph into groups that can be validated independently.
+
+    Shapes are assigned round-robin in IRI order, so every process splitting the same
+    shapes graph gets the same groups.
+
+    Args:
+        shapes_graph (rdflib.Graph): The SHACL shapes graph.
+        group_count (int): Number of groups.
+
+    Returns:
+        list: `group_count` shapes graphs (some may be empty if there are fewer shapes).
+    """
+
+    groups = [Graph() for _ in range(group_count)]
+    shapes = sorted(set(shapes_graph.subjects(RDF.type, SH.NodeShape)), key=str)
+
+    for index, shape in enumerate(shapes):
+        group = groups[index % group_count]
+        copy_shape(shapes_graph, shape, group)
+        copy_shape_targets(shapes_graph, shape, group)
+
+    return groups
+
+
+class InferredDataGraph:
+    """
+    RDFS closure of the ontology graph, kept up to date incrementally for validation.
+
+    The static schema (the subclass, subproperty, domain and range axioms) is separated from
+    the data and its closure is computed once. The closure of the whole graph is computed
+    once as well; after that, only the sensor delta is expanded against the schema: the
+    consequences of added triples are added, and the consequences of removed triples are
+    retracted unless they are still derivable from the remaining triples of the nodes
+    involved (delete/rederive). The result equals the RDFS expansion pyshacl would compute
+    for inference='rdfs', so it can be validated with inference='none' and without copying.
+
+    Graphs layered over a shared base graph (see OverlayStore) can share the closure of the
+    base graph as well: given the InferredDataGraph of the base, only the changes of the
+    closure are kept, in an overlay.
+
+    With `compact`, the closure is kept dictionary-encoded in a CompactStore, with its changes
+    in an overlay (see `compact_graph`), like a compact ontology graph.
+
+    Args:
+        graph (rdflib.Graph): The ontology graph (schema and instance data).
+        base (InferredDataGraph, optional): The closure of the shared graph `graph` is layered
+            over, while `graph` has no changes of its own yet. Defaults to None.
+        compact (bool, optional): Whether to keep the closure in a CompactStore. Defaults to False.
+    """
+
+    SCHEMA_AXIOM_PREDICATES = {RDFS.subClassOf, RDFS.subPropertyOf, RDFS.domain, RDFS.range}
+
+    def __init__(self, graph, base=None, compact=False):
+
+        self.pending_delta = [] #(action, triple) pairs applied to the ontology graph but not yet expanded
+        self.pending_delta_limit = COALESCE_SIZE #length at which pending_delta is coalesced
+        self.compact = compact
+
+        if base is None:
+            self.rebuild(graph)
+        else:
+            self.schema_graph = base.schema_graph
+            self.schema_closure = base.schema_closure
+            self.sub_properties = base.sub_properties
+            self.graph = overlay_graph(base.graph)
+
+
+    def rebuild(self, graph):
+        """
+        Recompute the schema closure and the closure of the whole graph.
+
+        Args:
+            graph (rdflib.Graph): The ontology graph.
+        """
+
+        self.schema_graph = Graph()
+        for predicate in self.SCHEMA_AXIOM_PREDICATES:
+            for triple in graph.triples((None, predicate, None)):
+                self.schema_graph.add(triple)
+
+        self.schema_closure = set(rdfs_closure(self.schema_graph))
+
+        self.sub_properties = {} #property -> itself and its subproperties
+        for sub_property, predicate, super_property in self.schema_closure:
+            if predicate == RDFS.subPropertyOf:
+                self.sub_properties.setdefault(super_property, {super_property}).add(sub_property)
+
+        self.graph = compact_graph(rdfs_closure(graph)) if self.compact else rdfs_closure(graph)
+
+
+    def consequences(self, triples):
+        """
+        Get the RDFS consequences of instance triples under the schema (including the triples).
+
+        Args:
+            triples (iterable): RDFLib triples.
+
+        Returns:
+            set: Triples entailed by the schema plus the given triples, but not by the schema alone.
+        """
+
+        closure = rdfs_closure(self.schema_graph, triples)
+        return {triple for triple in closure if triple not in self.schema_closure}
+
+
+    def record(self, changes):
+        """
+        Record changes applied to the ontology graph, to be expanded on the next update.
+
+        Between two updates (e.g. while sensor data is streamed without validation), the
+        recorded changes are coalesced to one per triple whenever they double in length, so
+        they grow with the triples changed rather than with the number of changes.
+
+        Args:
+            changes (list): (action, triple) pairs.
+        """
+
+        self.pending_delta.extend(changes)
+        if len(self.pending_delta) >= self.pending_delta_limit:
+            self.pending_delta = coalesce_changes(self.pending_delta)
+            self.pending_delta_limit = max(COALESCE_SIZE, 2 * len(self.pending_delta))
+
+
+    def update(self, graph):
+        """
+        Bring the closure up to date with the changes recorded since the last update.
+
+        Args:
+            graph (rdflib.Graph): The (already updated) ontology graph.
+        """
+
+        delta = self.pending_delta
+        self.pending_delta = []
+
+        if not delta:
+            return
+
+        if any(p in self.SCHEMA_AXIOM_PREDICATES for _, (_, p, _) in delta):
+            self.rebuild(graph)
+            return
+
+        removed = {triple for action, triple in delta if action == "remove" and triple not in graph}
+        added = {triple for action, triple in delta if action == "add" and triple in graph}
+
+        if removed:
+            candidates = self.consequences(removed)
+
+            #rederive: everything the remaining triples of the affected nodes still entail
+            support = set()
+            for node in {s for s, _, _ in candidates}:
+                support.update(graph.triples((node, None, None)))
+                support.update(graph.triples((None, None, node)))
+                #a single use of a property (or of a subproperty) is enough to entail its property typing
+                for sub_property in self.sub_properties.get(node, (node,)):
+                    first_use = next(graph.triples((None, sub_property, None)), None)
+                    if first_use is not None:
+                        support.add(first_use)
+                        break
+            still_entailed = self.consequences(support)
+
+            for triple in candidates - still_entailed:
+                self.graph.remove(triple)
+
+        if added:
+            for triple in self.consequences(added):
+                self.graph.add(triple)
+
+
+def rdfs_closure(graph, extra_triples=()):
+    """
+    Compute the RDFS closure of a graph the way pyshacl does for inference='rdfs'.
+
+    Args:
+        graph (rdflib.Graph): The graph to expand (not modified).
+        extra_triples (iterable, optional): Additional triples to include. Defaults to ().
+
+    Returns:
+        rdflib.Graph: A new graph holding the closure.
+    """
+
+    #Lazy import, owlrl is only needed when the closure is maintained outside pyshacl
+    import owlrl
+    from pyshacl.inference import CustomRDFSSemantics
+
+    closure = Graph()
+    closure.addN((s, p, o, closure) for s, p, o in graph)
+    closure.addN((s, p, o, closure) for s, p, o in extra_triples)
+    owlrl.DeductiveClosure(CustomRDFSSemantics).expand(closure)
+
+    return closure
@@ -0,0 +1,211 @@
+from functools import lru_cache
+from rdflib import Graph, URIRef
+from rdflib.namespace import RDF, RDFS, OWL
+from rdflib.plugins.sparql import prepareQuery
+
+#local imports
+from shacl_utils import SH, copy_shape, copy_shape_targets
+
+#Shape properties the compiler understands (or that do not affect conformance)
+NODE_SHAPE_KEYS = {RDF.type, SH.targetNode, SH.targetClass, SH.property, SH.sparql, SH.name, SH.description, SH.message}
+PROPERTY_SHAPE_KEYS = {RDF.type, SH.path, SH.hasValue, SH["class"], SH["not"], SH.name, SH.description, SH.message}
+NOT_SHAPE_KEYS = {RDF.type, SH.hasValue}
+SPARQL_CONSTRAINT_KEYS = {RDF.type, SH.select, SH.message}
+
+#Number of focus nodes up to which a SPARQL constraint is run once per focus node, with $this
+#pre-bound, instead of once unbound over the whole data graph
+BOUND_QUERY_LIMIT = 32
+
+
+class CompiledShapes:
+    """
+    SHACL shapes compiled into direct triple-pattern probes.
+
+    Node shapes targeting nodes or classes whose constraints are simple value checks
+    (sh:hasValue, sh:not [sh:hasValue ...] and sh:class on an IRI path) or SPARQL-based
+    constraints (sh:sparql with a plain sh:select) are compiled. All other shapes are
+    collected in `fallback_shapes_graph`, to be validated by pyshacl.
+
+    The probes must run on the RDFS expansion of the data graph (see InferredDataGraph),
+    which is what pyshacl validates with inference='rdfs'.
+
+    Args:
+        shapes_graph (rdflib.Graph): The SHACL shapes graph.
+    """
+
+    def __init__(self, shapes_graph):
+
+        self.compiled_shapes = [] #(target nodes, target classes, property checks, SPARQL queries)
+        self.fallback_shapes_graph = Graph()
+
+        for shape in set(shapes_graph.subjects(RDF.type, SH.NodeShape)):
+            compiled_shape = compile_node_shape(shapes_graph, shape)
+
+            if compiled_shape is None:
+                copy_shape(shapes_graph, shape, self.fallback_shapes_graph)
+                copy_shape_targets(shapes_graph, shape, self.fallback_shapes_graph)
+            elif compiled_shape:
+                self.compiled_shapes.append(compiled_shape)
+
+
+    def conforms(self, data_graph):
+        """
+        Check whether a data graph conforms to the compiled shapes.
+
+        Args:
+            data_graph (rdflib.Graph): The RDFS expansion of the data graph.
+
+        Returns:
+            bool: True if no compiled shape is violated, False otherwise.
+        """
+
+        for target_nodes, target_classes, property_checks, sparql_queries in self.compiled_shapes:
+            focus_nodes = set(target_nodes)
+            for target_class in target_classes:
+                focus_nodes.update(data_graph.subjects(RDF.type, target_class))
+
+            if not focus_nodes:
+                continue
+
+            for focus_node in focus_nodes:
+                for check in property_checks:
+                    if not check(data_graph, focus_node):
+                        return False
+
+            for query in sparql_queries:
+                if len(focus_nodes) <= BOUND_QUERY_LIMIT: #e.g. the few nodes a scoped validation targets
+                    for focus_node in focus_nodes:
+                        if any(True for _ in data_graph.query(query, initBindings={"this": focus_node})):
+                            return False
+                else:
+                    for row in data_graph.query(query):
+                        if row[0] in focus_nodes:
+                            return False
+
+        return True
+
+
+def compile_node_shape(shapes_graph, shape):
+    """
+    Compile a node shape into probes.
+
+    Args:
+        shapes_graph (rdflib.Graph): The SHACL shapes graph.
+        shape (URIRef or BNode): The node shape.
+
+    Returns:
+        tuple: (target nodes, target classes, property checks, SPARQL queries); an empty tuple
+        if the shape is deactivated, or None if the shape cannot be compiled.
+    """
+
+    if (shape, SH.deactivated, None) in shapes_graph:
+        return ()
+
+    #implicit class targets (a shape that is also a class) are left to pyshacl
+    if (shape, RDF.type, RDFS.Class) in shapes_graph or (shape, RDF.type, OWL.Class) in shapes_graph:
+        return None
+
+    if set(shapes_graph.predicates(shape, None)) - NODE_SHAPE_KEYS:
+        return None
+
+    property_checks = []
+    for property_shape in shapes_graph.objects(shape, SH.property):
+        checks = compile_property_shape(shapes_graph, property_shape)
+        if checks is None:
+            return None
+        property_checks.extend(checks)
+
+    sparql_queries = []
+    for constraint in shapes_graph.objects(shape, SH.sparql):
+        if set(shapes_graph.predicates(constraint, None)) - SPARQL_CONSTRAINT_KEYS:
+            return None
+        query = compile_sparql_select(str(shapes_graph.value(constraint, SH.select)))
+        if query is None:
+            return None
+        sparql_queries.append(query)
+
+    target_nodes = list(shapes_graph.objects(shape, SH.targetNode))
+    target_classes = list(shapes_graph.objects(shape, SH.targetClass))
+
+    return target_nodes, target_classes, property_checks, sparql_queries
+
+
+def compile_property_shape(shapes_graph, property_shape):
+    """
+    Compile a property shape into probes.
+
+    Args:
+        shapes_graph (rdflib.Graph): The SHACL shapes graph.
+        property_shape (URIRef or BNode): The property shape.
+
+    Returns:
+        list: Checks taking (data graph, focus node) and returning True if the focus node
+        conforms, or None if the property shape cannot be compiled.
+    """
+
+    if set(shapes_graph.predicates(property_shape, None)) - PROPERTY_SHAPE_KEYS:
+        return None
+
+    path = shapes_graph.value(property_shape, SH.path)
+    if not isinstance(path, URIRef):
+        return None
+
+    checks = []
+
+    for value in shapes_graph.objects(property_shape, SH.hasValue):
+        checks.append(has_value_check(path, value))
+
+    for required_class in shapes_graph.objects(property_shape, SH["class"]):
+        checks.append(class_check(path, required_class))
+
+    for not_shape in shapes_graph.objects(property_shape, SH["not"]):
+        if set(shapes_graph.predicates(not_shape, None)) - NOT_SHAPE_KEYS:
+            return None
+        for value in shapes_graph.objects(not_shape, SH.hasValue):
+            checks.append(not_has_value_check(path, value))
+
+    return checks
+
+
+def has_value_check(path, value):
+    #sh:hasValue: the value must be among the values of the path
+    return lambda data_graph, focus_node: (focus_node, path, value) in data_graph
+
+
+def not_has_value_check(path, value):
+    #sh:not [sh:hasValue]: a value node conforms to the negated shape only if it is the value itself
+    return lambda data_graph, focus_node: (focus_node, path, value) not in data_graph
+
+
+def class_check(path, required_class):
+    #sh:class: every value must be an instance of the class (subclasses are in the RDFS expansion)
+    return lambda data_graph, focus_node: all((value, RDF.type, required_class) in data_graph
+                                              for value in data_graph.objects(focus_node, path))
+
+
+@lru_cache(maxsize=None)
+def compile_sparql_select(select):
+    """
+    Prepare the sh:select query of a SPARQL-based constraint for direct execution.
+
+    The query is run either once per focus node with ?this pre-bound, or once without
+    pre-binding it; the returned ?this values that are focus nodes of the shape are its
+    violations. Queries using other pre-bound variables are not compiled. Prepared queries
+    are cached by query text.
+
+    Args:
+        select (str): The sh:select query.
+
+    Returns:
+        Query: The prepared query, or None if it cannot be compiled.
+    """
+
+    if any(variable in select for variable in ("$shapesGraph", "$currentShape", "$value", "$PATH")):
+        return None
+
+    query = prepareQuery(select.replace("$this", "?this"))
+
+    if not query.algebra.PV or str(query.algebra.PV[0]) != "this":
+        return None
+
+    return query
@@ -0,0 +1,121 @@
+from collections import namedtuple
+from rdflib import Namespace
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+#Resource kind -> (predicate, direction) pairs linking a step to resources of that kind, in the
+#order of the UNION branches of the corresponding `*_for_steps` query; "inverse" predicates point
+#from the resource to the step
+RESOURCE_PREDICATES = {
+    "tools": [(OR.toolUsed, "forward"), (OR.toolUsedInStep, "inverse")],
+    "actors": [(OR.actor, "forward"), (OR.actsIn, "inverse")],
+    "capabilities": [(OR.requiresCapability, "forward")],
+    "materials": [(OR.materialUsed, "forward")],
+}
+
+#Predicate -> (resource kind, direction), for the predicates the profiles are built from
+PREDICATE_LINKS = {predicate: (kind, direction) for kind, links in RESOURCE_PREDICATES.items() for predicate, direction in links}
+
+StepProfile = namedtuple("StepProfile", list(RESOURCE_PREDICATES))
+
+
+class StepResourceProfiles:
+    """
+    Per-step table of the tools, actors, capabilities and materials of every step.
+
+    Built once from the materialized graph and kept current from the graph changes, it answers
+    the `*_for_steps` queries of `queries.py` (including their inverse properties) with lookups.
+    The resources of a step are kept as ordered sets (dict keys) in the order the queries return
+    them.
+
+    Args:
+        graph (rdflib.Graph): The materialized ontology graph.
+    """
+
+    def __init__(self, graph):
+
+        self.profiles = {} #step -> {kind -> {resource: None}}
+
+        steps = set()
+        for predicate, (_, direction) in PREDICATE_LINKS.items():
+            for s, _, o in graph.triples((None, predicate, None)):
+                steps.add(s if direction == "forward" else o)
+
+        for step in steps:
+            for kind in RESOURCE_PREDICATES:
+                self.build(graph, step, kind)
+
+
+    def build(self, graph, step, kind):
+        """
+        (Re)build the resources of one kind of a step from the graph.
+
+        Args:
+            graph (rdflib.Graph): The ontology graph.
+            step (URIRef): The step.
+            kind (str): The resource kind.
+        """
+
+        resources = {}
+        for predicate, direction in RESOURCE_PREDICATES[kind]:
+            if direction == "forward":
+                resources.update(dict.fromkeys(graph.objects(step, predicate)))
+            else:
+                resources.update(dict.fromkeys(graph.subjects(predicate, step)))
+
+        if resources:
+            self.profiles.setdefault(step, {})[kind] = resources
+        elif step in self.profiles:
+            self.profiles[step].pop(kind, None)
+
+
+    def update(self, graph, changes):
+        """
+        Bring the profiles up to date with changes applied to the graph.
+
+        Args:
+            graph (rdflib.Graph): The (already updated) ontology graph.
+            changes (list): The (action, triple) pairs that were applied.
+        """
+
+        affected = set()
+        for _, (s, p, o) in changes:
+            if p in PREDICATE_LINKS:
+                kind, direction = PREDICATE_LINKS[p]
+                affected.add((s if direction == "forward" else o, kind))
+
+        for step, kind in affected:
+            self.build(graph, step, kind)
+
+
+    def get_step_profile(self, step):
+        """
+        Get all resources of a step.
+
+        Args:
+            step (str): Local name of the step.
+
+        Returns:
+            StepProfile: The tools, actors, capabilities and materials of the step (lists of URIs).
+        """
+
+        profile = self.profiles.get(OR[step], {})
+        return StepProfile(**{kind: list(profile.get(kind, {})) for kind in RESOURCE_PREDICATES})
+
+
+    def get_resources(self, kind, steps):
+        """
+        Get the resources of one kind of several steps.
+
+        Args:
+            kind (str): "tools", "actors", "capabilities" or "materials".
+            steps (list): Local names of the steps.
+
+        Returns:
+            list: The distinct resource URIs, in step order, like the `*_for_steps` queries.
+        """
+
+        resources = {}
+        for step in steps:
+            resources.update(dict.fromkeys(self.profiles.get(OR[step], {}).get(kind, {})))
+        return list(resources)
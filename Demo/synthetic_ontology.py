@@ -0,0 +1,122 @@
+import random
+import sys
+from rdflib import Graph, Namespace, Literal
+from rdflib.namespace import RDF, OWL, XSD
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+
+def get_instances(graph, cls):
+    """
+    Get the explicitly typed instances of a class, in a stable order.
+
+    Args:
+        graph (rdflib.Graph): The ontology graph.
+        cls (URIRef): The class.
+
+    Returns:
+        list: The instance URIs, sorted.
+    """
+
+    return sorted(graph.subjects(RDF.type, cls), key=str)
+
+
+def add_individual(graph, individual, cls):
+    graph.add((individual, RDF.type, OWL.NamedIndividual))
+    graph.add((individual, RDF.type, cls))
+
+
+def generate_synthetic_ontology(base_path, plans=1, phases=5, steps=10, actors=10, seed=0):
+    """
+    Scale up the Twin OR ontology with synthetic procedures.
+
+    The base ontology (schema and the original procedure) is kept unchanged, so the simulator,
+    the sensor data and the SHACL shapes work on the result as before. Synthetic plans are added
+    next to it, built like the original ones: every plan has `phases` ordered phases with a task
+    and a start step, every phase a chain of `steps` steps (followedBy/follows, with every other
+    step co-occurring with its successor), and every step an action, an actor, a required
+    capability and a tool drawn from the base ontology's individuals and the synthetic actors.
+    The last phase of each plan is its final phase.
+
+    The number of synthetic individuals is plans * phases * (steps + 1) + plans + actors.
+
+    Args:
+        base_path (str): Path to the base ontology (RDF/XML).
+        plans (int, optional): Number of synthetic plans. Defaults to 1.
+        phases (int, optional): Phases per plan. Defaults to 5.
+        steps (int, optional): Steps per phase. Defaults to 10.
+        actors (int, optional): Number of synthetic actors. Defaults to 10.
+        seed (int, optional): Seed of the random choices. Defaults to 0.
+
+    Returns:
+        tuple:
+            graph (rdflib.Graph): The scaled-up ontology.
+            individual_count (int): Number of synthetic individuals added.
+    """
+
+    graph = Graph()
+    graph.parse(base_path, format="xml")
+    rng = random.Random(seed)
+
+    actions = get_instances(graph, OR.Action)
+    tasks = get_instances(graph, OR.Task)
+    tools = get_instances(graph, OR.Tool)
+    vision_capabilities = get_instances(graph, OR.Vision)
+    manipulation_capabilities = get_instances(graph, OR.Manipulation)
+
+    actor_capabilities = []
+    for actor_no in range(1, actors + 1):
+        actor = OR[f"Synthetic_Actor_{actor_no}"]
+        add_individual(graph, actor, OR.Actor)
+        vision_capability = rng.choice(vision_capabilities)
+        manipulation_capability = rng.choice(manipulation_capabilities)
+        graph.add((actor, OR.hasVisionCapability, vision_capability))
+        graph.add((actor, OR.hasManipulationCapability, manipulation_capability))
+        actor_capabilities.append((actor, (vision_capability, manipulation_capability)))
+
+    for plan_no in range(1, plans + 1):
+        plan = OR[f"Synthetic_Plan_{plan_no}"]
+        add_individual(graph, plan, OR.Plan)
+
+        for phase_no in range(1, phases + 1):
+            phase = OR[f"S{plan_no}_Phase{phase_no}"]
+            add_individual(graph, phase, OR.Phase)
+            graph.add((plan, OR.hasPhase, phase))
+            graph.add((phase, OR.phaseOrder, Literal(phase_no, datatype=XSD.int)))
+            graph.add((phase, OR.phaseTask, rng.choice(tasks)))
+            if phase_no == phases:
+                graph.add((phase, OR.isFinalPhase, Literal(True)))
+
+            previous_step = None
+            for step_no in range(1, steps + 1):
+                step = OR[f"Step_S{plan_no}_{phase_no}_{step_no}"]
+                add_individual(graph, step, OR.Step)
+                graph.add((phase, OR.hasStep, step))
+                graph.add((step, OR.inPhase, phase))
+                graph.add((step, OR.stepAction, rng.choice(actions)))
+                graph.add((step, OR.toolUsed, rng.choice(tools)))
+
+                actor, capabilities = rng.choice(actor_capabilities)
+                graph.add((step, OR.actor, actor))
+                graph.add((step, OR.requiresCapability, rng.choice(capabilities)))
+
+                if previous_step is None:
+                    graph.add((phase, OR.phaseStartStep, step))
+                else:
+                    graph.add((previous_step, OR.followedBy, step))
+                    graph.add((step, OR.follows, previous_step))
+                    if step_no % 2 == 0:
+                        graph.add((previous_step, OR["co-occur"], step))
+                previous_step = step
+
+    individual_count = plans * phases * (steps + 1) + plans + actors
+
+    return graph, individual_count
+
+
+if __name__ == "__main__":
+    #Usage: python synthetic_ontology.py output.owl [plans] [phases] [steps] [actors]
+    sizes = [int(argument) for argument in sys.argv[2:6]]
+    graph, individual_count = generate_synthetic_ontology('or_ontology.owl', *sizes)
+    graph.serialize(sys.argv[1], format="xml")
+    print(f"Wrote {len(graph)} triples ({individual_count} synthetic individuals) to {sys.argv[1]}")
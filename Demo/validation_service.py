@@ -0,0 +1,171 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from rdflib import Graph, Namespace
+
+#local imports
+from ontology_utils import load_and_materialize_ontology, apply_changes
+from overlay_store import overlay_graph
+from shacl_utils import run_pyshacl, split_shapes_graph, CONFORMING_REPORT
+
+OR = Namespace("http://www.semanticweb.org/Twin_OR/")
+
+#State of a worker process: the static ontology and the shapes graphs, loaded once by init_worker
+worker_state = {}
+
+
+def init_worker(ontology_path, shacl_shape_path, cache_dir, shape_groups, reasoner):
+    """
+    Preload the static ontology and the SHACL shapes in a worker process.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        cache_dir (str): Directory of the materialization cache, or None.
+        shape_groups (int): Number of groups the shapes are split into.
+        reasoner (str): Reasoner the ontology is materialized with.
+    """
+
+    worker_state["base_graph"] = load_and_materialize_ontology(ontology_path, reasoner=reasoner, cache_dir=cache_dir)
+
+    shacl_shapes_graph = Graph().parse(shacl_shape_path)
+    if shape_groups == 1:
+        worker_state["shapes_graphs"] = [shacl_shapes_graph]
+    else:
+        worker_state["shapes_graphs"] = split_shapes_graph(shacl_shapes_graph, shape_groups)
+
+
+def validate_changes(changes, shape_group=0):
+    """
+    Validate the static ontology with a set of changes applied (worker process).
+
+    The changes are applied to an overlay, so the preloaded ontology is never modified.
+
+    Args:
+        changes (list): (action, triple) pairs relative to the static ontology.
+        shape_group (int, optional): Index of the shapes group to validate against. Defaults to 0.
+
+    Returns:
+        tuple:
+            conforms (bool): True if the graph conforms to the SHACL rules, False otherwise.
+            validation_report (str): A human-readable report detailing validation results.
+    """
+
+    data_graph = overlay_graph(worker_state["base_graph"])
+    apply_changes(data_graph, changes)
+
+    shapes_graph = worker_state["shapes_graphs"][shape_group]
+    if len(shapes_graph) == 0:
+        return True, CONFORMING_REPORT
+
+    return run_pyshacl(data_graph, shapes_graph, 'rdfs')
+
+
+def combine_results(futures):
+    """
+    Combine the validation results of several shape groups into one future.
+
+    Args:
+        futures (list): Futures of (conforms, validation report) tuples.
+
+    Returns:
+        concurrent.futures.Future: Resolves to (conforms, validation report) once all futures are
+        done: the graph conforms if it conforms to every group, and the report joins the reports
+        of the groups that were violated.
+    """
+
+    combined = Future()
+    pending = [len(futures)]
+
+    def on_done(_):
+        pending[0] -= 1
+        if pending[0] > 0:
+            return
+
+        try:
+            results = [future.result() for future in futures]
+        except Exception as error:
+            combined.set_exception(error)
+            return
+
+        reports = [validation_report for is_valid, validation_report in results if not is_valid]
+        combined.set_result((not reports, "\n".join(reports) if reports else CONFORMING_REPORT))
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+    return combined
+
+
+class ValidationService:
+    """
+    Run SHACL validations in a pool of worker processes.
+
+    pyshacl is CPU-bound and holds the GIL, so validating several rooms (or one room against
+    a large set of shapes) in threads serializes on one core. Each worker process of this
+    service loads the static ontology and the shapes once; a validation request only ships
+    the changes of a graph relative to the static ontology, and its result is returned as a
+    future, so the caller never blocks on validation.
+
+    With `shape_groups` > 1, the shapes are split into groups that are validated in parallel,
+    and the results are combined.
+
+    The workers materialize the ontology themselves, so a `cache_dir` shared with the
+    simulators is recommended: the workers then load the cached materialization.
+
+    Args:
+        ontology_path (str): Path to the ontology file.
+        shacl_shape_path (str): Path to the SHACL shapes file.
+        cache_dir (str, optional): Directory of the materialization cache. Defaults to None.
+        max_workers (int, optional): Number of worker processes. Defaults to None (one per CPU).
+        shape_groups (int, optional): Number of groups the shapes are split into. Defaults to 1.
+        reasoner (str, optional): Reasoner the ontology is materialized with; it must be the
+            simulators' one. Defaults to "none", as for ORSimulator.
+    """
+
+    def __init__(self, ontology_path, shacl_shape_path, cache_dir=None, max_workers=None, shape_groups=1, reasoner="none"):
+
+        self.shape_groups = shape_groups
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                            initargs=(ontology_path, shacl_shape_path, cache_dir, shape_groups, reasoner))
+
+
+    def submit(self, changes):
+        """
+        Validate the static ontology with a set of changes applied, asynchronously.
+
+        Args:
+            changes (list): (action, triple) pairs relative to the static ontology.
+
+        Returns:
+            concurrent.futures.Future: Resolves to (conforms, validation report).
+        """
+
+        futures = [self.executor.submit(validate_changes, changes, shape_group) for shape_group in range(self.shape_groups)]
+
+        if len(futures) == 1:
+            return futures[0]
+        return combine_results(futures)
+
+
+    def submit_simulator(self, simulator):
+        """
+        Validate the current graph of a simulator, asynchronously.
+
+        Args:
+            simulator (ORSimulator): The simulator (or room) to validate.
+
+        Returns:
+            concurrent.futures.Future: Resolves to (conforms, validation report).
+        """
+
+        return self.submit(simulator.get_graph_changes())
+
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker processes.
+
+        Args:
+            wait (bool, optional): Whether to wait for pending validations. Defaults to True.
+        """
+
+        self.executor.shutdown(wait=wait)